@@ -1,6 +1,10 @@
 import streamlit as st, pandas as pd
-from rapidfuzz import process, fuzz
+import altair as alt
+import copy
+from pathlib import Path
 from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
+from appdata import (MODEL_FILES, FLAG_BITS, replace_dict, AppData, load_model,
+                     issue_label, compare_table)
 st.set_page_config(page_title="きらら掲載順位検索", layout="wide")
 
 # ① ページタイトル
@@ -45,150 +49,233 @@ with st.expander("補足事項はこちら"):
     """)
 
 
-# ② データ読み込み（master.csv は既存のまま）
-df = pd.read_csv("data/master.csv")
-@st.cache_data
-def load():
-    return pd.read_csv("data/master.csv")
-
-df = load()
-
-# ▼ URL をクリック可能なリンクにする JS 関数
-link_renderer = JsCode("""
-class UrlCellRenderer {
-    init(params){
-        const link = document.createElement('a');
-        link.href   = params.value;
-        link.target = '_blank';
-        link.rel    = 'noopener noreferrer';
-        link.textContent = params.value;
-        this.eGui = link;
-    }
-    getGui(){ return this.eGui; }
+# ② データ読み込み
+# ETL が書く正規化モデル（号・作品・掲載の 3 表）
+MODEL_DIR = Path("data/model")
+
+def show_stats(s: pd.Series) -> None:
+    """作品別集計のパネル"""
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("掲載回数", f"{s['appearances']} 回")
+    c2.metric("表紙", f"{s['covers']} 回")
+    c3.metric("巻頭カラー", f"{s['tops']} 回")
+    c4.metric("センターカラー", f"{s['centers']} 回")
+    st.caption(f"初出 {issue_label(s['first_issue'])} ／ 最終 {issue_label(s['last_issue'])}"
+               f" ／ 最高 {s['best_rank']} 位 ／ 平均 {s['mean_rank']:.1f} 位")
+
+def rank_chart(ser: pd.DataFrame, color: str = "雑誌名") -> alt.Chart:
+    """掲載順の推移（点）と雑誌ごとの移動平均（線）。上が 1 位"""
+    base = alt.Chart(ser).encode(
+        x=alt.X("号:T", title=None),
+        color=alt.Color(f"{color}:N", legend=alt.Legend(orient="bottom", title=None)),
+    )
+    tooltip = ["号:T", "雑誌名:N", "掲載順:Q"] + (["作品:N"] if "作品" in ser else [])
+    points = base.mark_circle(opacity=0.5).encode(
+        y=alt.Y("掲載順:Q", scale=alt.Scale(reverse=True, zero=False)),
+        tooltip=tooltip,
+    )
+    # 作品 × 雑誌ごとに線を分ける
+    detail = [c for c in ("作品", "雑誌名") if c in ser and c != color]
+    line = base.mark_line().encode(y="移動平均:Q", detail=detail)
+    return (points + line).properties(height=260)
+
+def compare_view(data) -> None:
+    """複数作品の掲載順・カラーを同じ号に揃えて比べる"""
+    sel = st.multiselect("比較する作品を選択", data.works["work"].tolist(),
+                         max_selections=8, placeholder="作品名を入力")
+    if not sel:
+        return
+    rows = data.rows_of_many(sel)
+    st.altair_chart(rank_chart(data.series_of_many(sel), color="作品"),
+                    use_container_width=True)
+    st.caption("表=表紙 ／ 巻=巻頭カラー ／ セ=センターカラー（同じ号に 2 話あれば ／ で区切る）")
+    st.dataframe(compare_table(rows, sel), hide_index=True, use_container_width=True)
+
+PAGE_SIZE = 50
+
+def browse_view(data) -> None:
+    """雑誌・期間・カラー種別で掲載行を絞り込む／1 号のラインナップを見る（サーバー側でページ分割）"""
+    mags = list(replace_dict)
+    c1, c2 = st.columns([2, 3])
+    sel_mags = c1.multiselect("雑誌", mags, default=mags, format_func=replace_dict.get)
+    months = [f"{y}-{m:02d}" for y, m in
+              sorted(set(zip(data.issues["year"].astype(int), data.issues["month"].astype(int))))]
+    lo, hi = c2.select_slider("期間", options=months, value=(months[0], months[-1]))
+    f1, f2, f3 = st.columns(3)
+    bits = (FLAG_BITS["is_cover"] * f1.checkbox("表紙")
+            | FLAG_BITS["is_top"] * f2.checkbox("巻頭カラー")
+            | FLAG_BITS["is_center"] * f3.checkbox("センターカラー"))
+
+    ym = lambda s: int(s[:4]) * 12 + int(s[5:])
+    in_range = data.issues[data.issues["magazine"].isin(sel_mags)
+                           & (data.issues["year"].astype(int) * 12 + data.issues["month"]
+                              ).between(ym(lo), ym(hi))]
+    issue = st.selectbox("号を指定（ラインナップ表示）", [None] + in_range["issue_key"].tolist()[::-1],
+                         format_func=lambda k: "指定しない" if k is None
+                                     else issue_label(data.issues["issue_id"].iat[k]))
+    if issue is not None:
+        rows = data.lineup_of(issue)
+        st.caption(f"{issue_label(data.issues['issue_id'].iat[issue])}：{len(rows)} 作品")
+        show_table(rows)
+        return
+
+    pos = data.browse(sel_mags, ym(lo), ym(hi), bits)
+    if not len(pos):
+        st.info("該当する掲載はありません")
+        return
+    pages = (len(pos) - 1) // PAGE_SIZE + 1
+    page = st.number_input("ページ", min_value=1, max_value=pages, value=1)
+    a = (page - 1) * PAGE_SIZE
+    st.caption(f"{len(pos)} 件中 {a + 1}–{min(a + PAGE_SIZE, len(pos))} 件（{page}/{pages} ページ）")
+    # 表示するページの行だけを取り出して送る
+    show_table(data.rows_at(pos[a:a + PAGE_SIZE], work=True))
+
+def show_table(rows: pd.DataFrame) -> None:
+    st.dataframe(rows, hide_index=True, use_container_width=True,
+                 column_config={"URL": st.column_config.LinkColumn("URL")})
+
+def data_version() -> str:
+    """モデルファイルの更新時刻とサイズ（夜間更新の commit で変わる）"""
+    stats = [(MODEL_DIR / f"{name}.parquet").stat() for name in MODEL_FILES]
+    return "-".join(f"{s.st_mtime_ns}:{s.st_size}" for s in stats)
+
+@st.cache_resource(max_entries=1)
+def load(version: str) -> AppData:
+    """
+    全セッションで共有する読み取り専用のデータ（version が変わったら読み直す）。
+    コピーせずに返すので、呼び出し側で書き換えないこと。
+    """
+    return load_model(MODEL_DIR)
+
+data = load(data_version())
+
+# ▼ AG Grid 表示用（オプション・ロケールは 1 度だけ作って使い回す）
+# ① フィルタ・メニューアイコンを消す ──────────
+GRID_CSS = """
+<style>
+/* ─── スマホ幅でもヘッダーを 2 文字入るように ─── */
+@media(max-width: 600px){
+.ag-icon-menu,
+.ag-icon-filter{
+    display:none !important;        /* アイコン非表示 */
+}
+.ag-header-cell-label{
+    white-space:normal !important;  /* 折り返し許可 */
+    line-height:1.1rem;
 }
-""")
+}
+</style>
+"""
+
+# --- 日本語ロケール ----------------
+jp_locale = {
+    "contains": "含む",
+    "notContains": "含まない",
+    "equals": "等しい",
+    "notEqual": "等しくない",
+    "greaterThan": "より大きい",
+    "greaterThanOrEqual": "以上",
+    "lessThan": "未満",
+    "lessThanOrEqual": "以下",
+    "inRange": "間",
+    "notEquals": "等しくない",
+    "startsWith": "で始まる",
+    "endsWith": "で終わる",
+    "blank": "空白",
+    "notBlank": "空白以外",
+    "andCondition": "かつ",
+    "orCondition": "または",
+    "filterOoo": "フィルター...",
+    "applyFilter": "適用",
+    "resetFilter": "リセット",
+    "cancelFilter": "キャンセル",
+    "clearFilter": "クリア",
+    "sortAscending": "昇順で並べ替え",
+    "sortDescending": "降順で並べ替え",
+    "hideColumn": "列を隠す",
+    "unpinColumn": "列の固定を解除",
+    "autosizeThis": "自動サイズ調整",
+    # 以下は必要に応じて追加（公式の localeText_JP.ts を丸ごと貼っても可）
+}
+
+@st.cache_resource
+def grid_options() -> dict:
+    """作品検索の表（show_cols 固定）の AG Grid オプション"""
+    # ▼ URL をクリック可能なリンクにする JS 関数
+    link_renderer = JsCode("""
+    class UrlCellRenderer {
+        init(params){
+            const link = document.createElement('a');
+            link.href   = params.value;
+            link.target = '_blank';
+            link.rel    = 'noopener noreferrer';
+            link.textContent = params.value;
+            this.eGui = link;
+        }
+        getGui(){ return this.eGui; }
+    }
+    """)
+    gb = GridOptionsBuilder.from_dataframe(data.rows_at(data.work_pos[:0]))
+    # ── ヘッダー折り返しを有効に（全列デフォルト） ──
+    gb.configure_default_column(
+        filter=True, sortable=True, resizable=True,
+        wrapHeaderText=True,
+        autoHeaderHeight=True
+    )
+    # 🔸 ② 各列にツールチップを付ける
+    for col in ["年", "月", "雑誌名", "掲載順"]:
+        gb.configure_column(col, headerTooltip="クリックで並べ替え")
+
+    gb.configure_column("掲載順",  header_name="掲\n載\n順")
+    gb.configure_column("雑誌名",  header_name="雑\n誌\n名")
+    gb.configure_column("表紙",    header_name="表\n紙",)
+    gb.configure_column("巻頭カラー", header_name="巻\n頭",)
+    gb.configure_column("センターカラー", header_name="セ\nン\nタ\nー\nカ\nラ\nー")
+    # 🔸 URL 列だけセルレンダラーを指定
+    gb.configure_column("URL", header_name="参\n照\n元\nU\nR\nL", cellRenderer=link_renderer)
+    grid_opts = gb.build()
+    grid_opts["localeText"] = jp_locale      # ★ ここがポイント
+    return grid_opts
+
+def is_small_screen() -> bool:
+    """User-Agent がスマホ・タブレットなら True（軽量表示の既定値）"""
+    ua = st.context.headers.get("User-Agent", "")
+    return any(k in ua for k in ("Mobi", "Android", "iPhone", "iPad"))
+
+mode = st.radio("表示", ["作品検索", "作品比較", "号・雑誌から探す"], horizontal=True,
+                label_visibility="collapsed")
+if mode == "作品比較":
+    compare_view(data)
+    st.stop()
+if mode == "号・雑誌から探す":
+    browse_view(data)
+    st.stop()
 
 query = st.text_input("作品名を入力してENTER（部分一致可）", "")
 if query:
-    cand = process.extract(
-        query,
-        df["work"].unique(),
-        scorer=fuzz.token_set_ratio,
-        limit=10,
-    )
-    sel = st.selectbox("候補を選択", [c[0] for c in cand])
+    # かな／カナ・全角／半角・記号の違いを無視して部分一致で探す
+    cand = data.search.search(query)
+    sel = st.selectbox("候補を選択", cand)
     if sel:
-        sub = (
-            df[df["work"] == sel]
-            .sort_values(["year", "month"])
-            .reset_index(drop=True)
-        )
-
-        # 英字表記から日本語表記への変換辞書
-        replace_dict = {
-            "kirara": "きらら",
-            "kirara-carat": "キャラット",
-            "kirara-forward": "フォワード",
-            "kirara-max": "MAX",
-            "kirara-miracle": "ミラク"
-        }
-        #日本語項目に修正
-        sub["年"] = sub["year"]
-        sub["月"] = sub["month"]
-        sub["掲載順"] = sub["rank"]
-        sub["URL"] = sub["url"]
-        sub["雑誌名"] = sub["magazine"].map(replace_dict).fillna(sub["magazine"])
-        # 見やすい表示用に絵文字カラム
-        sub["表紙"] = sub["is_cover"].map({True: "●", False: ""})
-        sub["巻頭カラー"] = sub["is_top"].map({True: "●", False: ""})
-        sub["センターカラー"] = sub["is_center"].map({True: "●", False: ""})
-        show_cols = [
-            "年",
-            "月",
-            "雑誌名",
-            "掲載順",
-            "表紙",
-            "巻頭カラー",
-            "センターカラー",
-            "URL",
-        ]
-        show_df = sub[show_cols]
-        # ① フィルタ・メニューアイコンを消す ──────────
-        st.markdown("""
-        <style>
-        /* ─── スマホ幅でもヘッダーを 2 文字入るように ─── */
-        @media(max-width: 600px){
-        .ag-icon-menu,
-        .ag-icon-filter{
-            display:none !important;        /* アイコン非表示 */
-        }
-        .ag-header-cell-label{
-            white-space:normal !important;  /* 折り返し許可 */
-            line-height:1.1rem;
-        }
-        }
-        </style>
-        """, unsafe_allow_html=True)
-
-        # ④ AG Grid のオプション作成
-        gb = GridOptionsBuilder.from_dataframe(show_df)      # ← show_df はフィルタ後の DataFrame
-        # ── ヘッダー折り返しを有効に（全列デフォルト） ──
-        gb.configure_default_column(
-            filter=True, sortable=True, resizable=True,
-            wrapHeaderText=True,        # ★ ← 追加
-            autoHeaderHeight=True       # ★ ← 追加
-        )
-
-        # --- 日本語ロケールを設定 ----------------
-        jp_locale = {
-            "contains": "含む",
-            "notContains": "含まない",
-            "equals": "等しい",
-            "notEqual": "等しくない",
-            "greaterThan": "より大きい",
-            "greaterThanOrEqual": "以上",
-            "lessThan": "未満",
-            "lessThanOrEqual": "以下",
-            "inRange": "間",
-            "notEquals": "等しくない",
-            "startsWith": "で始まる",
-            "endsWith": "で終わる",
-            "blank": "空白",
-            "notBlank": "空白以外",
-            "andCondition": "かつ",
-            "orCondition": "または",
-            "filterOoo": "フィルター...",
-            "applyFilter": "適用",
-            "resetFilter": "リセット",
-            "cancelFilter": "キャンセル",
-            "clearFilter": "クリア",
-            "sortAscending": "昇順で並べ替え",
-            "sortDescending": "降順で並べ替え",
-            "hideColumn": "列を隠す",
-            "unpinColumn": "列の固定を解除",
-            "autosizeThis": "自動サイズ調整",
-            # 以下は必要に応じて追加（公式の localeText_JP.ts を丸ごと貼っても可）
-        }
-        # 🔸 ② 各列にツールチップを付ける
-        for col in ["年", "月", "雑誌名", "掲載順"]:
-            gb.configure_column(col, headerTooltip="クリックで並べ替え")
-
-        gb.configure_column("掲載順",  header_name="掲\n載\n順")
-        gb.configure_column("雑誌名",  header_name="雑\n誌\n名")
-        gb.configure_column("表紙",    header_name="表\n紙",)
-        gb.configure_column("巻頭カラー", header_name="巻\n頭",)
-        gb.configure_column("センターカラー", header_name="セ\nン\nタ\nー\nカ\nラ\nー")
-        # 🔸 URL 列だけセルレンダラーを指定
-        gb.configure_column("URL", header_name="参\n照\n元\nU\nR\nL", cellRenderer=link_renderer)
-        grid_opts = gb.build()
-        grid_opts["localeText"] = jp_locale      # ★ ここがポイント
-
-        # ⑤ 表示
-        AgGrid(
-            show_df,
-            gridOptions=grid_opts,
-            height=600,
-            fit_columns_on_grid_load=True,
-            theme="streamlit",                  # 好みで light / dark テーマも可
-            allow_unsafe_jscode=True,     # ← これを追加
-        )
+        # 作品ごとに整形済みの行を引くだけ（並べ替え・列変換は load 時に済ませてある）
+        show_df = data.rows_of(sel)
+
+        # 作品別の集計と掲載順の推移（ETL で集計済みの表だけを使う）
+        show_stats(data.stats_of(sel))
+        st.altair_chart(rank_chart(data.series_of(sel)), use_container_width=True)
+
+        # ⑤ 表示（軽量表示は Streamlit 標準の表、それ以外は AG Grid）
+        fast = st.toggle("軽量表示", value=is_small_screen(), key="fast_table",
+                         help="スマホ向け。標準の表で表示します（列名クリックで並べ替え）")
+        if fast:
+            show_table(show_df)
+        else:
+            st.markdown(GRID_CSS, unsafe_allow_html=True)
+            AgGrid(
+                show_df,
+                gridOptions=copy.deepcopy(grid_options()),   # キャッシュ側は書き換えさせない
+                height=600,
+                fit_columns_on_grid_load=True,
+                theme="streamlit",                  # 好みで light / dark テーマも可
+                allow_unsafe_jscode=True,     # ← これを追加
+            )
@@ -0,0 +1,234 @@
+"""
+appdata.py
+ app.py が使うデータ構造（Streamlit に依存しない部分）。
+ ETL が書く data/model/ の表を読み、作品検索・作品別／号別の表示用インデックスを作る。
+ tools/bench.py からも import して計測する。
+"""
+from __future__ import annotations
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz
+
+MODEL_FILES = ("issues", "works", "appearances", "work_stats", "rank_series")
+
+FLAG_BITS = {"is_cover": 1, "is_top": 2, "is_center": 4}
+
+# 英字表記から日本語表記への変換辞書
+replace_dict = {
+    "kirara": "きらら",
+    "kirara-carat": "キャラット",
+    "kirara-forward": "フォワード",
+    "kirara-max": "MAX",
+    "kirara-miracle": "ミラク"
+}
+show_cols = [
+    "年",
+    "月",
+    "雑誌名",
+    "掲載順",
+    "表紙",
+    "巻頭カラー",
+    "センターカラー",
+    "URL",
+]
+
+# ▼ 作品名検索 ──────────────────────────────
+def fold(s: str) -> str:
+    """検索用の正規化: NFKC（全角/半角）→ 小文字 → カタカナをひらがな → 記号・空白を除く"""
+    s = unicodedata.normalize("NFKC", s).casefold()
+    out = []
+    for c in s:
+        if "ァ" <= c <= "ヶ":
+            c = chr(ord(c) - 0x60)
+        if unicodedata.category(c)[0] in "PSZ":
+            continue
+        out.append(c)
+    return "".join(out)
+
+class SearchIndex:
+    """
+    正規化した作品名の 2-gram 転置索引で候補を絞り、rapidfuzz.cdist で一括採点する。
+    部分一致 (partial_ratio) → 全体の近さ (ratio) の順に並べる。直近のクエリは LRU で保持。
+    """
+    def __init__(self, titles, limit: int = 10, max_cand: int = 200):
+        self.titles = list(titles)
+        self.folded = [fold(t) for t in self.titles]
+        self.limit, self.max_cand = limit, max_cand
+        post: dict[str, list[int]] = {}
+        for i, f in enumerate(self.folded):
+            for g in set(f) | self._bigrams(f):
+                post.setdefault(g, []).append(i)
+        self.post = {g: np.array(v, dtype=np.int32) for g, v in post.items()}
+        self.search = lru_cache(maxsize=256)(self._search)
+
+    @staticmethod
+    def _bigrams(s: str) -> set[str]:
+        return {s[j:j + 2] for j in range(len(s) - 1)}
+
+    def _candidates(self, q: str) -> np.ndarray:
+        """q と共有する n-gram が多い順の候補（2-gram で足りなければ 1 文字も見る）"""
+        for grams, last in ((self._bigrams(q), False), (set(q), True)):
+            hits = [self.post[g] for g in grams if g in self.post]
+            if not hits:
+                continue
+            cnt = np.bincount(np.concatenate(hits), minlength=len(self.titles))
+            cand = np.flatnonzero(cnt)
+            if last or len(cand) >= self.limit:
+                return cand[np.argsort(-cnt[cand], kind="stable")[:self.max_cand]]
+        return np.arange(len(self.titles))
+
+    def _search(self, query: str) -> tuple[str, ...]:
+        q = fold(query)
+        if not q:
+            return ()
+        cand = self._candidates(q)
+        choices = [self.folded[i] for i in cand]
+        part = process.cdist([q], choices, scorer=fuzz.partial_ratio)[0]
+        full = process.cdist([q], choices, scorer=fuzz.ratio)[0]
+        order = np.lexsort((-full, -part))[:self.limit]
+        return tuple(self.titles[cand[i]] for i in order)
+
+@dataclass(frozen=True)
+class AppData:
+    issues: pd.DataFrame
+    works: pd.DataFrame
+    apps: pd.DataFrame
+    work_ids: pd.Series        # 作品名 → work_id
+    work_pos: np.ndarray       # apps の行位置を (work_id, 年, 月) 順に並べたもの
+    work_offsets: np.ndarray   # work_id の行は apps[work_pos[offsets[id]:offsets[id+1]]]
+    search: SearchIndex        # 作品名検索
+    stats: pd.DataFrame        # ETL の作品別集計（work_id 順）
+    series: pd.DataFrame       # ETL の掲載順推移（index は work_id）
+    issue_pos: np.ndarray      # apps の行位置を (issue_key, 掲載順) 順に並べたもの
+    issue_offsets: np.ndarray  # issue_key の行は apps[issue_pos[offsets[k]:offsets[k+1]]]
+    row_flags: np.ndarray      # issue_pos 各行の flags（FLAG_BITS のビット和）
+
+    def rows_at(self, pos: np.ndarray, *, work: bool = False) -> pd.DataFrame:
+        """apps の pos 行だけを表示用テーブルに整形する（work=True で 作品 列付き）"""
+        k = self.apps["issue_key"].values[pos]
+        flags = self.apps["flags"].values[pos]
+        mag = pd.Categorical(self.issues["magazine"])     # 雑誌名は categories だけ変換
+        labels = np.array([replace_dict.get(c, c) for c in mag.categories], dtype=object)
+        mark = lambda bit: np.where(flags & bit, "●", "")
+        table = pd.DataFrame({
+            "年": self.issues["year"].values[k],
+            "月": self.issues["month"].values[k],
+            "雑誌名": labels[mag.codes[k]],
+            "掲載順": self.apps["rank"].values[pos],
+            # 見やすい表示用に絵文字カラム
+            "表紙": mark(FLAG_BITS["is_cover"]),
+            "巻頭カラー": mark(FLAG_BITS["is_top"]),
+            "センターカラー": mark(FLAG_BITS["is_center"]),
+            "URL": self.issues["url"].values[k],
+        })[show_cols]
+        if work:
+            table.insert(4, "作品", self.works["work"].values[self.apps["work_id"].values[pos]])
+        return table
+
+    def rows_of(self, work: str) -> pd.DataFrame:
+        """作品の表示用テーブル（その作品の行だけを整形）"""
+        w = self.work_ids[work]
+        return self.rows_at(self.work_pos[self.work_offsets[w]:self.work_offsets[w + 1]])
+
+    def stats_of(self, work: str) -> pd.Series:
+        return self.stats.iloc[self.work_ids[work]]
+
+    def series_of(self, work: str) -> pd.DataFrame:
+        return self.series.loc[[self.work_ids[work]]]
+
+    def rows_of_many(self, works: list[str]) -> pd.DataFrame:
+        """複数作品の表示用行をまとめて整形する（作品 列付き）"""
+        ids = self.work_ids[works].values
+        starts, ends = self.work_offsets[ids], self.work_offsets[ids + 1]
+        pos = np.concatenate([self.work_pos[s:e] for s, e in zip(starts, ends)])
+        return self.rows_at(pos).assign(作品=np.repeat(works, ends - starts))
+
+    def lineup_of(self, issue_key: int) -> pd.DataFrame:
+        """号のラインナップ（掲載順、作品 列付き）"""
+        return self.rows_at(self.issue_pos[self.issue_offsets[issue_key]:
+                                           self.issue_offsets[issue_key + 1]], work=True)
+
+    def browse(self, mags: list[str], ym_from: int, ym_to: int, flag_bits: int) -> np.ndarray:
+        """
+        雑誌・期間 (year*12+month) で号を絞り、flag_bits のどれかが立つ行に絞った
+        apps 上の位置を (号, 掲載順) 順で返す（flag_bits=0 なら全行）。
+        表示するページぶんだけ rows_at(pos, work=True) で整形する
+        """
+        ym = self.issues["year"].values.astype(int) * 12 + self.issues["month"].values
+        keys = np.flatnonzero(self.issues["magazine"].isin(mags).values
+                              & (ym >= ym_from) & (ym <= ym_to))
+        if not len(keys):
+            return np.array([], dtype=np.int64)
+        starts, ends = self.issue_offsets[keys], self.issue_offsets[keys + 1]
+        pos = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        if flag_bits:
+            pos = pos[(self.row_flags[pos] & flag_bits) != 0]
+        return self.issue_pos[pos]
+
+    def series_of_many(self, works: list[str]) -> pd.DataFrame:
+        ids = self.work_ids[works]
+        names = pd.Series(ids.index, index=ids.values)
+        ser = self.series.loc[ids.values]
+        return ser.assign(作品=names.reindex(ser.index).values)
+
+def issue_label(issue_id: str) -> str:
+    """kirara-max-2013-01 → MAX 2013年1月"""
+    mag, y, m = issue_id[:-8], issue_id[-7:-3], issue_id[-2:]
+    return f"{replace_dict.get(mag, mag)} {y}年{int(m)}月"
+
+def prepare_series(series: pd.DataFrame) -> pd.DataFrame:
+    """グラフ用に日付・日本語雑誌名を付けて work_id で引けるようにする"""
+    mag = series["magazine"].astype(str)
+    return pd.DataFrame({
+        "号": pd.to_datetime(dict(year=series["year"], month=series["month"], day=1)),
+        "雑誌名": mag.map(replace_dict).fillna(mag),
+        "掲載順": series["rank"],
+        "移動平均": series["rank_avg"],
+    }).set_index(series["work_id"])
+
+def compare_table(rows: pd.DataFrame, works: list[str]) -> pd.DataFrame:
+    """号 × 作品の掲載順（表紙=表 / 巻頭=巻 / センター=セ を添える）を横に並べる"""
+    marks = (np.where(rows["表紙"] != "", "表", "")
+             + np.where(rows["巻頭カラー"] != "", "巻", "")
+             + np.where(rows["センターカラー"] != "", "セ", ""))
+    cell = rows["掲載順"].astype(str) + np.where(marks != "", " " + marks, "")
+    t = (rows.assign(cell=cell)
+             .pivot_table(index=["年", "月", "雑誌名"], columns="作品", values="cell",
+                          aggfunc="／".join, sort=True)
+             .reindex(columns=works)
+             .fillna(""))
+    return t.reset_index()
+
+def build_issue_index(issues: pd.DataFrame, apps: pd.DataFrame):
+    """apps の行位置を (号, 掲載順) 順に並べた配列と、号ごとの開始位置・その順の flags を返す"""
+    order = np.lexsort((apps["rank"].values, apps["issue_key"].values)).astype(np.int32)
+    offsets = np.searchsorted(apps["issue_key"].values[order], np.arange(len(issues) + 1))
+    return order, offsets, apps["flags"].values[order]
+
+def build_work_index(issues: pd.DataFrame, works: pd.DataFrame, apps: pd.DataFrame):
+    """apps の行位置を (作品, 年, 月) 順に並べた配列と、作品ごとの開始位置を返す"""
+    k = apps["issue_key"].values
+    ym = issues["year"].values.astype(np.int32)[k] * 12 + issues["month"].values[k]
+    order = np.lexsort((ym, apps["work_id"].values)).astype(np.int32)
+    offsets = np.searchsorted(apps["work_id"].values[order], np.arange(len(works) + 1))
+    return order, offsets
+
+
+def build_app_data(issues: pd.DataFrame, works: pd.DataFrame, apps: pd.DataFrame,
+                   stats: pd.DataFrame, series: pd.DataFrame) -> AppData:
+    """正規化モデルの 5 表 → AppData（インデックスはここで 1 度だけ作る）"""
+    work_ids = pd.Series(works["work_id"].values, index=works["work"])
+    work_pos, work_offsets = build_work_index(issues, works, apps)
+    return AppData(issues, works, apps, work_ids, work_pos, work_offsets,
+                   SearchIndex(works["work"]), stats, prepare_series(series),
+                   *build_issue_index(issues, apps))
+
+def load_model(model_dir: Path | str) -> AppData:
+    model_dir = Path(model_dir)
+    return build_app_data(*(pd.read_parquet(model_dir / f"{name}.parquet")
+                            for name in MODEL_FILES))
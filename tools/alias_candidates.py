@@ -0,0 +1,120 @@
+"""
+alias_candidates.py
+ overrides/aliases.csv に足すべき表記ゆれ（話数の接尾辞・記号や空白の違い・「2本立て」など）の
+ 候補を出す。master の一意な作品名を雑誌ごとにまとめ、rapidfuzz.cdist で類似度行列を
+ BLOCK 行ずつ一括計算し、掲載期間が重なる（SLACK か月の余裕込み）組だけを残す。
+ 掲載回数の多い方を canonical、少ない方を alias とし、類似度の高い順に並べる。
+  $ python tools/alias_candidates.py
+  $ python tools/alias_candidates.py --min_score 90 --magazine kirara --out cand.csv
+"""
+from __future__ import annotations
+import argparse, re, sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+BASE = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE))                       # appdata.py（リポジトリ直下）
+
+from appdata import fold
+from validate import load_master
+
+MIN_SCORE = 85          # fuzz.ratio（0–100）の下限
+SLACK     = 3           # 掲載期間の重なりを見るときの前後の余裕（か月）
+BLOCK     = 2048        # cdist を一度に計算する行数（メモリ上限 BLOCK × 作品数 バイト）
+# fold 後の作品名から落とす連載上の接尾辞（2本立て1本目・前編・第3話 など）
+VARIANT_RE = re.compile(r"(?:\d+本立て)?\d+本目$|[前後中]編$|[上下]巻$|第?\d+話$|その\d+$")
+
+CAND_COLS = ["magazine", "score", "alias", "canonical", "alias_n", "canonical_n",
+             "alias_span", "canonical_span"]
+
+# ────────────────────────────────────────────────────────────────
+def match_key(work: str) -> str:
+    """比較用のキー: fold（全角/半角・かな・記号・空白を吸収）してから接尾辞を落とす"""
+    k = fold(work)
+    return VARIANT_RE.sub("", k) or k
+
+def work_spans(master: pd.DataFrame) -> pd.DataFrame:
+    """(magazine, work) ごとの掲載回数と初出・最終の月番号 (year*12 + month-1)"""
+    ym = master["year"].astype(int) * 12 + master["month"].astype(int) - 1
+    t = (master.assign(ym=ym, magazine=master["magazine"].astype(str),
+                       work=master["work"].astype(str))
+               .groupby(["magazine", "work"], sort=True)["ym"]
+               .agg(n="size", first="min", last="max")
+               .reset_index())
+    t["key"] = t["work"].map(match_key)
+    return t
+
+def _span(first: int, last: int) -> str:
+    return f"{first // 12}-{first % 12 + 1:02d}〜{last // 12}-{last % 12 + 1:02d}"
+
+def magazine_pairs(g: pd.DataFrame, min_score: int = MIN_SCORE,
+                   slack: int = SLACK) -> list[tuple[int, int, int]]:
+    """1 雑誌ぶんの作品表 g から (i, j, score)（i < j、g 内の位置）を返す"""
+    keys = g["key"].tolist()
+    first, last = g["first"].to_numpy(), g["last"].to_numpy()
+    out = []
+    for lo in range(0, len(keys), BLOCK):
+        hi = min(lo + BLOCK, len(keys))
+        # 下限未満は 0 で返る。行列は uint8 で持つ
+        sc = process.cdist(keys[lo:hi], keys, scorer=fuzz.ratio, dtype=np.uint8,
+                           score_cutoff=min_score, workers=-1)
+        overlap = ((first[lo:hi, None] <= last[None, :] + slack)
+                   & (first[None, :] <= last[lo:hi, None] + slack))
+        upper = np.arange(lo, hi)[:, None] < np.arange(len(keys))[None, :]
+        ii, jj = np.nonzero((sc >= min_score) & overlap & upper)
+        out += zip((ii + lo).tolist(), jj.tolist(), sc[ii, jj].tolist())
+    return out
+
+def find_candidates(master: pd.DataFrame, min_score: int = MIN_SCORE,
+                    slack: int = SLACK) -> pd.DataFrame:
+    """master → 候補表（CAND_COLS、類似度の高い順）"""
+    spans = work_spans(master)
+    rows = []
+    for mag, g in spans.groupby("magazine", sort=True):
+        g = g.reset_index(drop=True)
+        for i, j, score in magazine_pairs(g, min_score, slack):
+            a, b = g.iloc[i], g.iloc[j]
+            # 掲載回数が多い方（同数なら後まで続いた方）を正とする
+            if (a["n"], a["last"]) > (b["n"], b["last"]):
+                a, b = b, a
+            rows.append((mag, score, a["work"], b["work"], a["n"], b["n"],
+                         _span(a["first"], a["last"]), _span(b["first"], b["last"])))
+    cand = pd.DataFrame(rows, columns=CAND_COLS)
+    return cand.sort_values(["score", "alias_n", "magazine"],
+                            ascending=[False, True, True], kind="stable") \
+               .reset_index(drop=True)
+
+# ────────────────────────────────────────────────────────────────
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("master", nargs="?", default=None,
+                    help="master.parquet / master.csv（既定は Parquet 優先）")
+    ap.add_argument("--magazine", nargs="*", help="対象雑誌（省略で全て）")
+    ap.add_argument("--min_score", type=int, default=MIN_SCORE,
+                    help=f"類似度の下限 0–100（デフォルト {MIN_SCORE}）")
+    ap.add_argument("--slack", type=int, default=SLACK,
+                    help=f"掲載期間の重なりに許す前後の余裕（か月、デフォルト {SLACK}）")
+    ap.add_argument("--top", type=int, default=50, help="表示する件数")
+    ap.add_argument("--out", help="候補をすべて CSV に書き出す（alias, canonical 列は aliases.csv と同じ）")
+    args = ap.parse_args()
+
+    master = load_master(args.master)
+    if args.magazine:
+        master = master[master["magazine"].astype(str).isin(args.magazine)]
+    cand = find_candidates(master, args.min_score, args.slack)
+    if cand.empty:
+        print("✅ 候補なし")
+        return
+    print(cand.head(args.top).to_string(index=False))
+    if args.out:
+        cand.to_csv(args.out, index=False, encoding="utf-8-sig")
+        print(f"✅ {len(cand)} candidates → {args.out}")
+    else:
+        print(f"✅ {len(cand)} candidates")
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,254 @@
+"""
+backfill.py
+ kirara_issue_urls.csv の全期間（2007〜）を raw に取り込む、長時間実行向けのモード。
+  - 仕事を (雑誌, 年) のシャードに分け、終わったシャードから raw_store・data/raw/<slug>.csv・
+    .cache/scrape_state.csv に書き込む（メモリに持つのは 1 シャード分の行だけ）
+  - 終わったシャードは .cache/backfill/checkpoint.json に記録し、再実行すると続きから
+  - 取得に失敗した号は tenacity で指数バックオフしながらその場で再試行し、
+    それでも駄目なら .cache/backfill/retry_queue.csv に積む。
+    キューの号は次回以降の実行の最初に、待ち時間（RETRY_BASE × 2^(試行回数-1)、
+    上限 RETRY_MAX）を過ぎたものから取り直す。
+    一時的でない失敗（404 など・--offline でのキャッシュ無し）と、MAX_QUEUE_ATTEMPTS 回
+    失敗した号は status=dead にして再試行しない（--revive で待ち行列に戻す）
+  $ python tools/backfill.py                              # 全期間・全誌
+  $ python tools/backfill.py --start 2010 --end 2015 --slug kirara
+  $ python tools/backfill.py --retry_only                 # 再試行キューだけ処理
+  $ python tools/backfill.py --retry_only --revive        # dead の号も取り直す
+  $ python tools/backfill.py --restart                    # チェックポイントを捨てて最初から
+"""
+from __future__ import annotations
+import argparse, json, os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd, requests
+from tenacity import (Retrying, retry_if_exception, stop_after_attempt,
+                      wait_exponential)
+
+from fetch import Fetcher, Page
+from html_cache import HtmlCache
+from raw_store import write_csv_atomic
+from scrape import (PARSER_VERSION, is_settled, load_state, load_urls, merge_raw,
+                    save_state, scrape_issue)
+import metrics
+
+BASE_DIR   = Path(__file__).resolve().parents[1] / ".cache" / "backfill"
+CHECKPOINT = BASE_DIR / "checkpoint.json"
+RETRY_CSV  = BASE_DIR / "retry_queue.csv"
+URL_CSV    = Path(__file__).resolve().parent / "kirara_issue_urls.csv"
+
+ATTEMPTS   = 4                          # その場での試行回数（初回を含む）
+RETRY_BASE = timedelta(hours=1)         # キューに積んだ号の次回試行までの待ち（初回）
+RETRY_MAX  = timedelta(days=7)
+MAX_QUEUE_ATTEMPTS = 8                  # キューでの試行がこの回数に達したら dead
+
+Job = tuple[str, str, int, int]         # (url, slug, year, month)
+
+# ────────────────────────────────────────────────────────────────
+def _transient(e: BaseException) -> bool:
+    """時間を置けば通りそうな失敗か（接続断・タイムアウト・429・5xx）"""
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+def fetch_with_retry(job: Job, fetcher: Fetcher,
+                     prev: dict | None) -> tuple[Page, list[dict] | None]:
+    """scrape_issue を一時的な失敗に限り指数バックオフで ATTEMPTS 回まで試す"""
+    for attempt in Retrying(retry=retry_if_exception(_transient),
+                            wait=wait_exponential(multiplier=1, min=1, max=30),
+                            stop=stop_after_attempt(ATTEMPTS), reraise=True,
+                            before_sleep=lambda _: metrics.count("backfill.retries")):
+        with attempt:
+            return scrape_issue(job[0], job[1], fetcher, prev)
+
+# ────────────────────────────────────────────────────────────────
+class RetryQueue:
+    """
+    失敗した号の永続キュー（CSV）。失敗のたびに次の試行時刻を指数的に延ばす。
+    一時的でない失敗と試行回数の上限に達した号は status=dead（due に出さない）
+      queue = RetryQueue()
+      for job in queue.due(): ...
+      queue.fail(job, err) / queue.done(url)
+      queue.save()
+    """
+    COLS = ["url", "magazine", "year", "month", "attempts", "status", "next_try",
+            "last_error"]
+
+    def __init__(self, path: Path = RETRY_CSV):
+        self.path = path
+        self.items: dict[str, dict] = {}
+        if path.exists():
+            df = pd.read_csv(path, encoding="utf-8-sig")
+            if "status" not in df.columns:
+                df["status"] = "retry"
+            self.items = {r["url"]: r for r in df.to_dict("records")}
+
+    def __len__(self) -> int:
+        """再試行待ちの号の数（dead は数えない）"""
+        return sum(r["status"] == "retry" for r in self.items.values())
+
+    def dead(self) -> int:
+        return sum(r["status"] == "dead" for r in self.items.values())
+
+    def revive(self) -> None:
+        """dead の号を今すぐ再試行できる状態に戻す（試行回数はリセット）"""
+        now = datetime.now().isoformat(timespec="seconds")
+        for r in self.items.values():
+            if r["status"] == "dead":
+                r.update(status="retry", attempts=0, next_try=now)
+
+    def due(self, now: datetime | None = None) -> list[Job]:
+        now = now or datetime.now()
+        return [(r["url"], r["magazine"], int(r["year"]), int(r["month"]))
+                for r in self.items.values()
+                if r["status"] == "retry" and datetime.fromisoformat(r["next_try"]) <= now]
+
+    def fail(self, job: Job, err: Exception, now: datetime | None = None) -> None:
+        now = now or datetime.now()
+        url, slug, yr, mo = job
+        attempts = int(self.items.get(url, {}).get("attempts", 0)) + 1
+        wait = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+        dead = not _transient(err) or attempts >= MAX_QUEUE_ATTEMPTS
+        self.items[url] = dict(url=url, magazine=slug, year=int(yr), month=int(mo),
+                               attempts=attempts, status="dead" if dead else "retry",
+                               next_try=(now + wait).isoformat(timespec="seconds"),
+                               last_error=f"{type(err).__name__}: {err}"[:200])
+
+    def done(self, url: str) -> None:
+        self.items.pop(url, None)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        df = pd.DataFrame(list(self.items.values()), columns=self.COLS)
+        write_csv_atomic(df.sort_values(["magazine", "year", "month", "url"]), self.path)
+
+# ────────────────────────────────────────────────────────────────
+def load_checkpoint(path: Path = CHECKPOINT) -> set[str]:
+    """終わったシャード（"kirara/2013" 形式）"""
+    if not path.exists():
+        return set()
+    return set(json.loads(path.read_text(encoding="utf-8")).get("done", []))
+
+def save_checkpoint(done: set[str], path: Path = CHECKPOINT) -> None:
+    body = dict(done=sorted(done), updated=datetime.now().isoformat(timespec="seconds"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(body, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+def shards(df_urls: pd.DataFrame) -> list[tuple[str, list[Job]]]:
+    """URL 一覧を (雑誌, 年) ごとのジョブ列に分ける（雑誌名・年の順）"""
+    out = []
+    for (slug, yr), g in df_urls.groupby(["種別", "年"], sort=True):
+        jobs = [(u, slug, int(yr), int(m)) for u, m in zip(g["URL"], g["月"])]
+        out.append((f"{slug}/{yr}", jobs))
+    return out
+
+def run_jobs(jobs: list[Job], fetcher: Fetcher, state: dict[str, dict],
+             queue: RetryQueue) -> int:
+    """
+    jobs を取得・パースして raw と scrape_state に書き込む。新しい行数を返す。
+    失敗した号はキューへ、成功した号はキューから外す（キューの保存は呼び出し側）
+    """
+    prev = {j[0]: state.get(j[0]) for j in jobs}       # worker からは読むだけ
+    rows_by_slug: dict[str, list[dict]] = {}
+    changed_by_slug: dict[str, set[str]] = {}
+    for job, res, err in fetcher.map(lambda j: fetch_with_retry(j, fetcher, prev[j[0]]),
+                                     jobs):
+        url, slug, yr, mo = job
+        if err is not None:
+            print("  [RETRY LATER]", url, err)
+            metrics.count("backfill.failed")
+            queue.fail(job, err)
+            continue
+        queue.done(url)
+        page, rows = res
+        state[url] = dict(url=url, magazine=slug, year=int(yr), month=int(mo),
+                          sha256=page.sha256, fetched_at=page.fetched_at,
+                          parser_version=PARSER_VERSION)
+        if rows is None:
+            continue
+        changed_by_slug.setdefault(slug, set()).add(url)
+        rows_by_slug.setdefault(slug, []).extend(rows)
+
+    total = 0
+    if changed_by_slug:
+        with metrics.timer("scrape.merge"):
+            total, _ = merge_raw(rows_by_slug, changed_by_slug)
+    # raw を書き終えてから状態を保存（途中で落ちたらそのシャードをやり直す）
+    save_state(state)
+    return total
+
+def backfill(df_urls: pd.DataFrame, *, rps: float = 2.0, workers: int = 4,
+             offline: bool = False, recheck: bool = False,
+             retry_only: bool = False, revive: bool = False) -> None:
+    done  = load_checkpoint()
+    queue = RetryQueue()
+    if revive:
+        queue.revive()
+    state = load_state()
+    fetcher = Fetcher(rps=rps, workers=workers, cache=HtmlCache(), offline=offline)
+
+    # ─── 1) 待ち時間を過ぎた再試行キュー ───
+    due = queue.due()
+    if due:
+        print(f"↻ retry queue: {len(due)}/{len(queue)} issues due")
+        n = run_jobs(due, fetcher, state, queue)
+        queue.save()
+        print(f"  ✓ {n} rows, {len(queue)} still queued")
+    if retry_only:
+        return
+
+    # ─── 2) (雑誌, 年) シャードを順に ───
+    plan = [(k, jobs) for k, jobs in shards(df_urls) if k not in done]
+    print(f"▶ {len(plan)} shards to go ({len(done)} done)")
+    for i, (key, jobs) in enumerate(plan, 1):
+        if not recheck:
+            jobs = [j for j in jobs if not is_settled(state.get(j[0]), j[2], j[3])]
+        with metrics.timer("backfill.shard"):
+            n = run_jobs(jobs, fetcher, state, queue)
+        queue.save()
+        done.add(key)
+        save_checkpoint(done)
+        metrics.count("backfill.shards")
+        print(f"  ✓ [{i}/{len(plan)}] {key}: {len(jobs)} issues, {n} rows"
+              + (f"  (queued {len(queue)})" if len(queue) else ""))
+
+    print(f"\n✅ backfill done: {len(done)} shards"
+          + (f", {len(queue)} issues in retry queue → {RETRY_CSV}" if len(queue) else ""))
+    if queue.dead():
+        print(f"⚠ {queue.dead()} issues gave up (status=dead) → {RETRY_CSV}")
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", type=int, default=2007)
+    ap.add_argument("--end",   type=int)
+    ap.add_argument("--slug", nargs="*", help="対象雑誌（省略で全て）")
+    ap.add_argument("--url_csv", default=str(URL_CSV))
+    ap.add_argument("--rps", type=float, default=2.0,
+                    help="ホストあたり秒間リクエスト数の上限（デフォルト 2）")
+    ap.add_argument("--workers", type=int, default=4,
+                    help="同時リクエスト数の上限（デフォルト 4）")
+    ap.add_argument("--offline", action="store_true",
+                    help="ネットワークに出ず HTML キャッシュだけで処理する")
+    ap.add_argument("--recheck", action="store_true",
+                    help="確定済み (SETTLE_MONTHS 経過) の号も再取得する")
+    ap.add_argument("--retry_only", action="store_true",
+                    help="再試行キューのうち待ち時間を過ぎた号だけ処理する")
+    ap.add_argument("--revive", action="store_true",
+                    help="status=dead の号も再試行キューに戻す")
+    ap.add_argument("--restart", action="store_true",
+                    help="チェックポイントを捨てて最初のシャードから")
+    args = ap.parse_args()
+
+    if args.restart:
+        CHECKPOINT.unlink(missing_ok=True)
+    df_urls = load_urls(args.url_csv, args.start, args.end)
+    if args.slug:
+        df_urls = df_urls[df_urls["種別"].isin(args.slug)]
+    backfill(df_urls, rps=args.rps, workers=args.workers, offline=args.offline,
+             recheck=args.recheck, retry_only=args.retry_only, revive=args.revive)
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
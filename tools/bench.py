@@ -0,0 +1,217 @@
+"""
+bench.py
+ オフラインで回せる計測スイート。ネットワークには出ない。
+  - scrape : tools/bench_fixtures/ の号ページ（旧レイアウト／新レイアウト × 本誌／フォワード）を
+             高速パーサと bs4 版でパース
+  - etl    : 今の raw を 1× / 10× / 100× に複製した合成データで alias → issues_fix → dedupe、
+             正規化モデルの生成
+  - validate : 同じ合成 master で validate_df
+  - alias  : 同じ合成 master でエイリアス候補の探索（alias_candidates.find_candidates）
+  - app    : appdata のインデックス構築、作品名検索（LRU を通さない素の検索）、作品／号の引き当て
+ 結果は JSON（既定 .cache/bench/bench-<日時>.json）。compare で基準と比べて遅くなった項目を出す。
+  $ python tools/bench.py run
+  $ python tools/bench.py run --scales 1,10 --out base.json
+  $ python tools/bench.py compare base.json .cache/bench/bench-20250601-120000.json
+"""
+from __future__ import annotations
+import argparse, contextlib, io, json, platform, statistics, sys, time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+BASE = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE))                       # appdata.py（リポジトリ直下）
+
+import alias_candidates, etl, validate
+from scrape import parse_html
+from appdata import build_app_data
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "bench_fixtures"
+OUT_DIR     = BASE / ".cache" / "bench"
+# (ファイル, URL（年月でレイアウトが決まる）, 雑誌)
+FIXTURES = [
+    ("kirara_old.html",  "https://www.dokidokivisual.com/magazine/kirara/2024/05/10643/", "kirara"),
+    ("kirara_new.html",  "https://www.dokidokivisual.com/magazine/kirara/2025/05/12320/", "kirara"),
+    ("forward_old.html", "https://www.dokidokivisual.com/magazine/kirara-forward/2024/05/11276/", "kirara-forward"),
+    ("forward_new.html", "https://www.dokidokivisual.com/magazine/kirara-forward/2025/05/12257/", "kirara-forward"),
+]
+QUERIES = ["ゆゆ式", "ケイオン", "ｽﾛｳｽﾀｰﾄ", "newgame", "きんいろ", "まちカド", "うさぎ", "あ"]
+DEFAULT_THRESHOLD = 0.25      # compare: 25% 以上遅くなったら警告
+NOISE_MS = 0.5                # compare: これ未満の差は無視
+
+# ────────────────────────────────────────────────────────────────
+def measure(fn: Callable[[], object], *, repeat: int = 5, number: int = 1) -> dict:
+    """fn を number 回 × repeat 回実行し、1 回あたりの ms（中央値・最小）を返す"""
+    per_call = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - t) * 1000 / number)
+    return {"ms": round(statistics.median(per_call), 4),
+            "min_ms": round(min(per_call), 4), "runs": repeat * number}
+
+def synthetic_raw(raw: pd.DataFrame, scale: int) -> pd.DataFrame:
+    """
+    raw（issue_id 付き）を scale 倍に複製する。
+    i 番目の複製は雑誌名・URL・作品名に接尾辞を付けて別の号・別の作品として扱わせる
+    （0 番目は元のまま。issues_fix / aliases が当たるのはここだけ）
+    """
+    frames = [raw]
+    for i in range(1, scale):
+        c = raw.copy()
+        c["magazine"] = c["magazine"] + f"-s{i}"
+        c["url"]      = c["url"] + f"?s={i}"
+        c["work"]     = c["work"] + f" #{i}"
+        frames.append(c)
+    df = pd.concat(frames, ignore_index=True)
+    df["issue_id"] = (df["magazine"] + "-" + df["year"].astype(str) + "-"
+                      + df["month"].astype(str).str.zfill(2))
+    return df
+
+@contextlib.contextmanager
+def quiet():
+    """apply_issue_fixes などの標準出力を計測中は捨てる"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def _calibration_work() -> None:
+    """マシンの速さを測るための決まった処理（compare で機械差・負荷の補正に使う）"""
+    s = pd.Series(range(200_000))
+    (s % 7).groupby(s % 101).sum()
+    sum(i * i for i in range(200_000))
+
+# ────────────────────────────────────────────────────────────────
+def bench_parse(results: dict) -> None:
+    for name, url, mag in FIXTURES:
+        html = (FIXTURE_DIR / name).read_text(encoding="utf-8")
+        key = Path(name).stem
+        results[f"scrape.parse_fast.{key}"] = measure(
+            lambda: parse_html(html, url, mag, fast=True), number=20)
+        results[f"scrape.parse_bs4.{key}"] = measure(
+            lambda: parse_html(html, url, mag, fast=False), number=5)
+
+def bench_scale(results: dict, raw: pd.DataFrame, scale: int) -> None:
+    tag = f"@{scale}x"
+    repeat = {1: 5, 10: 3}.get(scale, 1)
+    df = synthetic_raw(raw, scale)
+    print(f"… {scale}x: {len(df)} rows", file=sys.stderr)
+
+    with quiet():
+        aliased = etl.apply_alias(df.copy())
+        fixed   = etl.apply_issue_fixes(aliased.copy())
+        master  = etl.transform(df.copy())[etl.MASTER_COLS]
+        results["etl.apply_alias" + tag] = measure(
+            lambda: etl.apply_alias(df.copy()), repeat=repeat)
+        results["etl.apply_issue_fixes" + tag] = measure(
+            lambda: etl.apply_issue_fixes(aliased.copy()), repeat=repeat)
+        results["etl.dedupe_two_episode_color" + tag] = measure(
+            lambda: etl.dedupe_two_episode_color(fixed.copy()), repeat=repeat)
+        results["etl.transform" + tag] = measure(
+            lambda: etl.transform(df.copy()), repeat=repeat)
+
+    results["etl.normalize" + tag] = measure(lambda: etl.normalize(master), repeat=repeat)
+    issues, works, apps = etl.normalize(master)
+    stats, series = etl.work_stats(issues, works, apps), etl.rank_series(issues, apps)
+    results["etl.work_stats" + tag] = measure(
+        lambda: etl.work_stats(issues, works, apps), repeat=repeat)
+    results["etl.rank_series" + tag] = measure(
+        lambda: etl.rank_series(issues, apps), repeat=repeat)
+
+    ignore = validate.load_ignore()
+    results["validate.validate_df" + tag] = measure(
+        lambda: validate.validate_df(master, ignore=ignore), repeat=repeat)
+    results["alias.find_candidates" + tag] = measure(
+        lambda: alias_candidates.find_candidates(master), repeat=repeat)
+
+    results["app.build" + tag] = measure(
+        lambda: build_app_data(issues, works, apps, stats, series), repeat=repeat)
+    data = build_app_data(issues, works, apps, stats, series)
+    results["app.search" + tag] = measure(
+        lambda: [data.search._search(q) for q in QUERIES], number=5)
+    sample = works["work"].sample(min(len(works), 200), random_state=0).tolist()
+    results["app.rows_of" + tag] = measure(lambda: [data.rows_of(w) for w in sample])
+    results["app.rows_of_many" + tag] = measure(lambda: data.rows_of_many(sample[:8]), number=20)
+    mags = ["kirara", "kirara-max"]
+    results["app.browse" + tag] = measure(
+        lambda: data.browse(mags, 2015 * 12 + 1, 2020 * 12 + 12, etl.FLAG_BITS["is_center"]),
+        number=20)
+
+def run(scales: list[int], out: Path) -> dict:
+    results: dict[str, dict] = {"calibration": measure(_calibration_work, repeat=7)}
+    bench_parse(results)
+    with quiet():
+        raw = etl.load_raw()
+    for s in scales:
+        bench_scale(results, raw, s)
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__,
+            "machine": platform.platform(), "scales": scales,
+            "base_rows": len(raw),
+        },
+        "results": results,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+    for k, v in results.items():
+        print(f"{k:45s} {v['ms']:10.3f} ms")
+    print(f"✅ {len(results)} benchmarks → {out}")
+    return report
+
+# ────────────────────────────────────────────────────────────────
+def compare(base_path: Path, new_path: Path, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    基準より threshold 以上（かつ NOISE_MS 以上）遅くなった項目名を返す。
+    揺れの小さい最小値 (min_ms) で比べ、calibration の比でマシンの速さの差を割り戻す
+    """
+    base = json.loads(base_path.read_text(encoding="utf-8"))["results"]
+    new  = json.loads(new_path.read_text(encoding="utf-8"))["results"]
+    speed = 1.0
+    if "calibration" in base and "calibration" in new:
+        speed = new["calibration"]["min_ms"] / base["calibration"]["min_ms"]
+        print(f"   calibration ×{speed:.2f}（この比で補正）")
+    slower = []
+    for k in sorted((base.keys() & new.keys()) - {"calibration"}):
+        b, n = base[k]["min_ms"], new[k]["min_ms"] / speed
+        ratio = n / b if b else float("inf")
+        bad = ratio > 1 + threshold and n - b > NOISE_MS
+        mark = "❌" if bad else ("✨" if ratio < 1 - threshold else "  ")
+        print(f"{mark} {k:45s} {b:10.3f} → {n:10.3f} ms  ×{ratio:.2f}")
+        if bad:
+            slower.append(k)
+    for k in sorted(base.keys() - new.keys()):
+        print(f"   {k:45s} （新しい結果に無し）")
+    return slower
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="計測して JSON に保存")
+    r.add_argument("--scales", default="1,10,100", help="合成データの倍率（カンマ区切り）")
+    r.add_argument("--out", default=None, help="結果 JSON（既定 .cache/bench/bench-<日時>.json）")
+    c = sub.add_parser("compare", help="基準 JSON と比べて遅くなった項目で exit 1")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help="許容する遅れの割合（既定 0.25 = 25%%）")
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        out = Path(args.out) if args.out else \
+              OUT_DIR / f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+        run([int(s) for s in args.scales.split(",")], out)
+    else:
+        slower = compare(Path(args.base), Path(args.new), args.threshold)
+        if slower:
+            print(f"❌ {len(slower)} benchmarks slower than baseline")
+            sys.exit(1)
+        print("✅ no regressions")
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,52 @@
+"""
+check_dedupe.py
+ ベクトル化した etl.dedupe_two_episode_color が、以前の groupby ループ版と
+ 同じ結果を返すかを確かめる。差分があれば exit 1。
+  - raw → alias → issues_fix 済みの全行で 2 つを突き合わせる
+  - 今の master.csv に当てても 1 行も変わらない（冪等）こと
+  $ python tools/check_dedupe.py
+"""
+from __future__ import annotations
+import sys
+
+import pandas as pd
+
+from etl import DST, load_raw, apply_alias, apply_issue_fixes, dedupe_two_episode_color
+
+# ────────────────────────────────────────────────────────────────
+def dedupe_reference(df: pd.DataFrame) -> pd.DataFrame:
+    """基準: 号×作品ごとのループ版"""
+    for (iss, work), g in df.groupby(["issue_id", "work"]):
+        if len(g) <= 1:
+            continue
+        for flag in ["is_top", "is_center"]:
+            flag_rows = g[g[flag]].sort_values("rank").index
+            if len(flag_rows) > 1:
+                df.loc[flag_rows[1:], flag] = False
+    return df
+
+def _diff(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """値が食い違う行（a 側）"""
+    ne = (a != b) & ~(a.isna() & b.isna())
+    return a[ne.any(axis=1)]
+
+def cli() -> None:
+    df = apply_issue_fixes(apply_alias(load_raw()))
+    ref = dedupe_reference(df.copy())
+    got = dedupe_two_episode_color(df.copy())
+
+    master = pd.read_csv(DST, encoding="utf-8-sig")
+    again  = dedupe_two_episode_color(master.copy())
+
+    bad_raw, bad_master = _diff(got, ref), _diff(again, master)
+    for label, bad in (("raw", bad_raw), ("master.csv", bad_master)):
+        if len(bad):
+            print(f"❌ {label}: {len(bad)} rows differ")
+            print(bad[["issue_id", "work", "rank", "is_top", "is_center"]].head(20).to_string())
+    if len(bad_raw) or len(bad_master):
+        sys.exit(1)
+    print(f"✅ vectorized dedupe == loop on {len(df)} rows; master.csv unchanged ({len(master)} rows)")
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,52 @@
+"""
+check_parser.py
+ 高速パーサ (scrape.extract_fast) と基準の bs4 版が同じ行を返すかを、
+ HTML キャッシュにある全号ページで突き合わせる。差分があれば exit 1。
+  $ python tools/check_parser.py
+  $ python tools/check_parser.py --show 3     # 差分の中身を 3 号ぶん表示
+"""
+from __future__ import annotations
+import argparse, re, sys
+
+from html_cache import HtmlCache, CACHE_DIR
+from scrape import parse_html
+
+ISSUE_RE = re.compile(r"/magazine/([^/]+)/\d{4}/\d{2}/\d+/$")
+
+# ────────────────────────────────────────────────────────────────
+def check(cache: HtmlCache, show: int = 0) -> tuple[int, list[str]]:
+    """(検査した号数, 差分のあった URL) を返す"""
+    n, bad = 0, []
+    for entry in cache.entries():
+        m = ISSUE_RE.search(entry.url)
+        if not m:                       # 年ページは対象外
+            continue
+        html = cache.read(entry)
+        ref  = parse_html(html, entry.url, m.group(1), fast=False)
+        got  = parse_html(html, entry.url, m.group(1), fast=True)
+        n += 1
+        if ref != got:
+            bad.append(entry.url)
+            if len(bad) <= show:
+                print("✗", entry.url)
+                print("  bs4 :", [(r["work"], r["is_cover"], r["is_top"], r["is_center"]) for r in ref])
+                print("  fast:", [(r["work"], r["is_cover"], r["is_top"], r["is_center"]) for r in got])
+    return n, bad
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cache_dir", default=str(CACHE_DIR))
+    ap.add_argument("--show", type=int, default=0, help="差分を詳細表示する号数")
+    args = ap.parse_args()
+
+    n, bad = check(HtmlCache(args.cache_dir), args.show)
+    if bad:
+        print(f"❌ {len(bad)} / {n} issues differ")
+        for url in bad:
+            print("  ", url)
+        sys.exit(1)
+    print(f"✅ fast parser == bs4 parser on {n} issues")
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
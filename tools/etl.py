@@ -1,15 +1,47 @@
 """
 raw/*.csv → master.csv へ統合・正規化・手動フィックス適用
-$ python tools/etl.py
+$ python tools/etl.py           # 入力が変わった (雑誌, 年) パーティションだけ再計算
+$ python tools/etl.py --full    # 全パーティションを作り直す
+
+パーティションごとの入力ハッシュ（raw 行 + その年の issues_fix 行 + aliases.csv
++ ETL_VERSION）を data/etl_manifest.json に持ち、前回と違うものだけ
+master.csv 上で差し替える。中身が変わった issue_id も manifest に残す。
+
+同じ内容を型付きの data/master.parquet にも書く（app / validate はこちらを優先）。
+  magazine / url / work / issue_id … category（Parquet では辞書エンコード）
+  year / month / rank … 小さい整数、is_* … bool
+
+あわせて正規化したモデルを data/model/ に書く（app はこちらを読む）。
+  issues.parquet       issue_key, magazine, year, month, url, issue_id（号ごとに 1 行）
+  works.parquet        work_id, work（作品名順に 0 から）
+  appearances.parquet  issue_key, work_id, rank, flags（FLAG_BITS のビット和）
+  work_stats.parquet   作品ごとの掲載回数・表紙/巻頭/センター回数・初出/最終号
+  rank_series.parquet  作品 × 雑誌 × 号の掲載順と、雑誌ごとの移動平均 (RANK_WINDOW 号)
 """
 import pandas as pd, unicodedata, re, glob
 from pathlib import Path
-import csv 
+import argparse, csv, hashlib, json
+import metrics
 
 BASE = Path(__file__).resolve().parents[1]
 RAW_DIR = BASE / "data" / "raw"
 OV_DIR  = BASE / "overrides"
 DST     = BASE / "data" / "master.csv"
+MANIFEST = BASE / "data" / "etl_manifest.json"
+PARQUET = BASE / "data" / "master.parquet"
+MODEL_DIR = BASE / "data" / "model"
+# 変換規則を変えたら +1 する（全パーティションを作り直す）
+ETL_VERSION = 1
+MASTER_COLS = ["magazine", "year", "month", "url", "work", "rank",
+               "is_cover", "is_top", "is_center", "issue_id"]
+MASTER_DTYPES = {
+    "magazine": "category", "year": "int16", "month": "int8", "url": "category",
+    "work": "category", "rank": "int16",
+    "is_cover": "bool", "is_top": "bool", "is_center": "bool", "issue_id": "category",
+}
+FLAG_BITS = {"is_cover": 1, "is_top": 2, "is_center": 4}
+ISSUE_COLS = ["magazine", "year", "month", "url", "issue_id"]
+RANK_WINDOW = 6      # 掲載順の移動平均をとる号数
 
 # ---------- 標準化 ----------
 def std(s:str):
@@ -18,55 +50,117 @@ def std(s:str):
     return s.strip()
 
 # ---------- エイリアス ----------
+def alias_table(titles, mapping: dict[str, str]) -> dict[str, str]:
+    """作品名 → std + エイリアス適用後の名前。std は一意な作品名ごとに 1 回だけ"""
+    table = {}
+    for t in pd.unique(titles):
+        s = std(t)
+        table[t] = mapping.get(s, s)
+    return table
+
 def apply_alias(df):
     alias_path = OV_DIR / "aliases.csv"
     if not alias_path.exists(): return df
     alias = pd.read_csv(alias_path)
     mapping = dict(zip(alias["alias"].map(std), alias["canonical"].map(std)))
-    df["work"] = df["work"].map(lambda x: mapping.get(std(x), std(x)))
+    df["work"] = df["work"].map(alias_table(df["work"], mapping))
     return df
 
 # ---------- 手動号修正 ----------
+FIX_FLAGS = ["is_cover", "is_top", "is_center"]
+
+def _match_fixes(df: pd.DataFrame, fix: pd.DataFrame) -> pd.DataFrame:
+    """
+    fix 各行が当たる df の行を (_row, _fix) の対応表で返す。
+    キーは (issue_id, work, rank)。work / rank が空の fix はその列を問わない。
+    """
+    left = pd.DataFrame({"issue_id": df["issue_id"].values, "work": df["work"].values,
+                         "rank": df["rank"].values, "_row": range(len(df))})
+    has_work, has_rank = fix["work"].notna(), fix["rank"].notna()
+    pairs = []
+    for w in (False, True):
+        for r in (False, True):
+            sub = fix[(has_work == w) & (has_rank == r)]
+            if sub.empty:
+                continue
+            on = ["issue_id"] + (["work"] if w else []) + (["rank"] if r else [])
+            pairs.append(left[on + ["_row"]].merge(sub[on + ["_fix"]], on=on)[["_row", "_fix"]])
+    if not pairs:
+        return pd.DataFrame({"_row": [], "_fix": []}, dtype="int64")
+    return pd.concat(pairs, ignore_index=True)
+
 def apply_issue_fixes(df):
+    """
+    overrides/issues_fix.csv（fixed=OK の行）を一括で当てる。
+    削除 → フラグ → rank の順に、それぞれ 1 回の join で処理する。
+    どの行にも当たらなかった修正は一覧で警告する。
+    """
     fix = pd.read_csv(OV_DIR /"issues_fix.csv")
-    for _, r in fix.iterrows():
-        if str(r.get("fixed")).upper() != "OK":
-            continue
-
-        mask = (df["issue_id"] == r["issue_id"])
-        if pd.notna(r.get("work")):
-            mask &= (df["work"] == r["work"])
-
-        # ----------------- 削除 -----------------
-        if r["field"] == "delete":
-            if pd.notna(r.get("value")):           # rank 指定があればさらに絞る
-                mask &= (df["rank"] == int(r["value"]))
-            df = df[~mask]
-            continue
-        # -------------- フラグ修正 --------------
-        if r["field"] in ("is_cover","is_top","is_center"):
-            df.loc[mask, r["field"]] = str(r["value"]).upper() == "TRUE"
-        elif r["field"] == "rank":
-            df.loc[mask, "rank"] = int(r["value"])
+    fix = fix[(fix["fixed"].astype(str).str.upper() == "OK") & fix["field"].notna()]
+    # 差分 ETL では対象パーティションの修正だけを見る
+    fix = fix[_part_of(fix["issue_id"].astype(str)).isin(set(_part_of(df["issue_id"])))]
+    fix = fix.assign(_fix=range(len(fix)), work=fix["work"].where(fix["work"].notna(), None))
+    is_del = fix["field"] == "delete"
+    # 削除だけは value が rank（空なら号×作品の全行）
+    fix["rank"] = pd.to_numeric(fix["value"].where(is_del), errors="coerce").astype("Int64")
+
+    df = df.reset_index(drop=True)
+    hit: set[int] = set()
+
+    # ----------------- 削除（anti-join） -----------------
+    m = _match_fixes(df, fix[is_del])
+    hit |= set(m["_fix"])
+    df = df.drop(index=m["_row"].unique()).reset_index(drop=True)
+
+    # -------------- フラグ修正 --------------
+    sub = fix[fix["field"].isin(FIX_FLAGS)].drop(columns="rank").assign(rank=pd.NA)
+    m = _match_fixes(df, sub).merge(sub[["_fix", "field", "value"]], on="_fix")
+    hit |= set(m["_fix"])
+    m = m.sort_values("_fix", kind="stable").drop_duplicates(["_row", "field"], keep="last")
+    for flag, g in m.groupby("field"):
+        df.loc[g["_row"].values, flag] = (g["value"].astype(str).str.upper() == "TRUE").values
+
+    # -------------- rank 修正 --------------
+    sub = fix[fix["field"] == "rank"].drop(columns="rank").assign(rank=pd.NA)
+    m = _match_fixes(df, sub).merge(sub[["_fix", "value"]], on="_fix")
+    hit |= set(m["_fix"])
+    m = m.sort_values("_fix", kind="stable").drop_duplicates("_row", keep="last")
+    df.loc[m["_row"].values, "rank"] = m["value"].astype(int).values
+
+    stale = fix[~fix["_fix"].isin(hit)]
+    if len(stale):
+        print(f"⚠ issues_fix.csv: {len(stale)} 件がどの行にも当たりません")
+        for r in stale.itertuples():
+            print(f"   {r.issue_id}  {r.work or '(作品指定なし)'}  {r.field}={r.value}")
     return df
 # ---------- カラー重複の整理 ----------  ★ 追加
 def dedupe_two_episode_color(df: pd.DataFrame) -> pd.DataFrame:
-    for (iss, work), g in df.groupby(["issue_id", "work"]):
-        if len(g) <= 1:
-            continue
-        # is_top と is_center を個別に整理
-        for flag in ["is_top", "is_center"]:
-            flag_rows = g[g[flag]].sort_values("rank").index
-            if len(flag_rows) > 1:
-                df.loc[flag_rows[1:], flag] = False
+    """
+    同じ号に 2 話載った作品は、is_top / is_center を rank が最小の 1 行だけに残す。
+    （号×作品が重複する行だけを見て、フラグごとに rank 順の通し番号 > 0 を落とす）
+    """
+    dup = df.duplicated(["issue_id", "work"], keep=False)
+    if not dup.any():
+        return df
+    for flag in ["is_top", "is_center"]:
+        g = df[dup & df[flag].astype(bool)].sort_values("rank", kind="stable")
+        extra = g.index[g.groupby(["issue_id", "work"]).cumcount().values > 0]
+        df.loc[extra, flag] = False
     return df
 
-# ---------- main ----------
-def main():
-    files = glob.glob(str(RAW_DIR / "*.csv"))
+# ---------- 入力の読み込み ----------
+def load_raw(given: dict[str, pd.DataFrame] | None = None) -> pd.DataFrame:
+    """
+    data/raw/*.csv を読む。given（slug → DataFrame、scrape.scrape の戻り値）に
+    ある雑誌は CSV を読み直さずにそれを使う
+    """
+    given = given or {}
+    files = sorted({*glob.glob(str(RAW_DIR / "*.csv")),
+                    *(str(RAW_DIR / f"{slug}.csv") for slug in given)})
     frames=[]
     for f in files:
-        df=pd.read_csv(f)
+        slug = Path(f).stem
+        df = given[slug].copy() if slug in given else pd.read_csv(f)
         # raw に magazine 列が無い旧ファイルはファイル名から補完
         if "magazine" not in df.columns:
             df["magazine"]=Path(f).stem           # kirara / kirara-max …
@@ -80,13 +174,194 @@ def main():
         df["year"].astype(str)+"-"+
         df["month"].astype(str).str.zfill(2)
     ).astype(str).str.zfill(2)
+    return df
+
+def transform(df: pd.DataFrame) -> pd.DataFrame:
+    """raw（issue_id 付き）→ master 行。どの段も issue_id の中で閉じている"""
     df = apply_alias(df)
     df = apply_issue_fixes(df)
     df = dedupe_two_episode_color(df)
-    df = df.sort_values(["magazine", "year", "month", "rank"])
-    df.to_csv(DST, index=False, encoding="utf-8-sig",
-          lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
-    print(f"✅ master.csv updated: {len(df)} rows")
+    return df.sort_values(["magazine", "year", "month", "rank"], kind="stable")
+
+# ---------- パーティション (雑誌, 年) ----------
+def _part_of(issue_id: pd.Series) -> pd.Series:
+    """kirara-2013-05 → kirara-2013"""
+    return issue_id.str[:-3]
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def partition_hashes(raw: pd.DataFrame) -> dict[str, str]:
+    """パーティションごとの入力ハッシュ"""
+    alias_path = OV_DIR / "aliases.csv"
+    common = f"{ETL_VERSION}:" + (_sha(alias_path.read_bytes()) if alias_path.exists() else "")
+    fix = pd.read_csv(OV_DIR / "issues_fix.csv")
+    fix_csv = {p: g.to_csv(index=False)
+               for p, g in fix.groupby(_part_of(fix["issue_id"].astype(str)))}
+
+    row_hash = pd.util.hash_pandas_object(raw.drop(columns="issue_id"), index=False)
+    out = {}
+    for p, h in row_hash.groupby(_part_of(raw["issue_id"]).values, sort=True):
+        out[p] = _sha(common.encode() + h.values.tobytes()
+                      + fix_csv.get(p, "").encode("utf-8"))
+    return out
+
+def _issue_digest(df: pd.DataFrame) -> dict[str, str]:
+    """issue_id → その号の master 行の要約（差分検出用）"""
+    if df.empty:
+        return {}
+    line = df[MASTER_COLS].astype(str).agg("|".join, axis=1)
+    return {iss: _sha("\n".join(g).encode("utf-8"))
+            for iss, g in line.groupby(df["issue_id"].values)}
+
+def load_manifest() -> dict:
+    if not MANIFEST.exists():
+        return {}
+    return json.loads(MANIFEST.read_text(encoding="utf-8"))
+
+def save_manifest(man: dict) -> None:
+    MANIFEST.write_text(json.dumps(man, ensure_ascii=False, indent=1, sort_keys=True)
+                        + "\n", encoding="utf-8")
+
+# ---------- Parquet ----------
+def to_typed(df: pd.DataFrame) -> pd.DataFrame:
+    """master 行 → 型付き DataFrame（列順は MASTER_COLS）"""
+    return df[MASTER_COLS].astype(MASTER_DTYPES).reset_index(drop=True)
+
+def write_parquet(df: pd.DataFrame, path: Path = PARQUET) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    to_typed(df).to_parquet(tmp, index=False, engine="pyarrow")
+    tmp.replace(path)
+
+# ---------- 正規化モデル ----------
+def normalize(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """master 行 → (issues, works, appearances)"""
+    df = to_typed(df)
+    issues = (df[ISSUE_COLS].drop_duplicates("issue_id")
+                .sort_values(["magazine", "year", "month"], kind="stable")
+                .reset_index(drop=True))
+    # 号ごとに 1 行なので url / issue_id は辞書にしない
+    issues = issues.astype({"url": str, "issue_id": str})
+    issues.insert(0, "issue_key", issues.index.astype("int32"))
+    issue_key = pd.Series(issues["issue_key"].values, index=issues["issue_id"].astype(str))
+
+    names = sorted(df["work"].astype(str).unique())
+    works = pd.DataFrame({"work_id": pd.RangeIndex(len(names)).astype("int32"), "work": names})
+    work_id = pd.Series(works["work_id"].values, index=names)
+
+    flags = sum(df[c].astype("uint8") * bit for c, bit in FLAG_BITS.items())
+    apps = pd.DataFrame({
+        "issue_key": issue_key.reindex(df["issue_id"].astype(str)).values,
+        "work_id":   work_id.reindex(df["work"].astype(str)).values,
+        "rank":      df["rank"].values,
+        "flags":     flags.astype("uint8").values,
+    })
+    return issues, works, apps
+
+def work_stats(issues: pd.DataFrame, works: pd.DataFrame, apps: pd.DataFrame) -> pd.DataFrame:
+    """作品ごとの集計（1 作品 1 行、work_id 順）"""
+    rows = apps.merge(issues[["issue_key", "year", "month", "issue_id"]], on="issue_key")
+    for col, bit in FLAG_BITS.items():
+        rows[col] = (rows["flags"] & bit) > 0
+    rows = rows.sort_values(["year", "month", "issue_key"], kind="stable")
+    stats = rows.groupby("work_id").agg(
+        appearances=("issue_key", "size"),
+        issues=("issue_key", "nunique"),
+        covers=("is_cover", "sum"), tops=("is_top", "sum"), centers=("is_center", "sum"),
+        best_rank=("rank", "min"), mean_rank=("rank", "mean"),
+        first_issue=("issue_id", "first"), last_issue=("issue_id", "last"),
+    )
+    out = works.merge(stats, left_on="work_id", right_index=True, how="left")
+    return out.astype({c: "int32" for c in ["appearances", "issues", "covers", "tops",
+                                            "centers", "best_rank"]})
+
+def rank_series(issues: pd.DataFrame, apps: pd.DataFrame) -> pd.DataFrame:
+    """
+    作品 × 号の掲載順（同じ号に 2 話あれば前の方）と、
+    作品 × 雑誌ごとの直近 RANK_WINDOW 号の移動平均
+    """
+    s = (apps.groupby(["work_id", "issue_key"], as_index=False)["rank"].min()
+             .merge(issues[["issue_key", "magazine", "year", "month"]], on="issue_key")
+             .sort_values(["work_id", "magazine", "year", "month"], kind="stable")
+             .reset_index(drop=True))
+    s["rank_avg"] = (s.groupby(["work_id", "magazine"], observed=True)["rank"]
+                      .rolling(RANK_WINDOW, min_periods=1).mean()
+                      .reset_index(level=[0, 1], drop=True)
+                      .astype("float32"))
+    return s[["work_id", "magazine", "year", "month", "rank", "rank_avg"]]
+
+def write_model(df: pd.DataFrame, out_dir: Path = MODEL_DIR) -> None:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    issues, works, apps = normalize(df)
+    tables = {"issues": issues, "works": works, "appearances": apps,
+              "work_stats": work_stats(issues, works, apps),
+              "rank_series": rank_series(issues, apps)}
+    for name, t in tables.items():
+        tmp = out_dir / f"{name}.parquet.tmp"
+        t.to_parquet(tmp, index=False, engine="pyarrow")
+        tmp.replace(out_dir / f"{name}.parquet")
+
+# ---------- main ----------
+def main(full: bool = False, given: dict[str, pd.DataFrame] | None = None
+         ) -> pd.DataFrame | None:
+    """
+    master.csv / Parquet / モデルを更新して master を返す（変化なしなら None）。
+    given は load_raw へそのまま渡す
+    """
+    with metrics.timer("etl.load_raw"):
+        raw = load_raw(given)
+        hashes = partition_hashes(raw)
+    metrics.count("etl.raw_rows", len(raw))
+
+    man = load_manifest()
+    reuse = (not full and DST.exists()
+             and man.get("etl_version") == ETL_VERSION
+             and man.get("master_sha256") == _sha(DST.read_bytes()))
+    old_hashes = man.get("partitions", {}) if reuse else {}
+    changed = {p for p, h in hashes.items() if old_hashes.get(p) != h}
+    changed |= set(old_hashes) - set(hashes)          # raw から消えたパーティション
+
+    if reuse and not changed:
+        man["changed_issues"] = []
+        save_manifest(man)
+        if not PARQUET.exists() or not (MODEL_DIR / "rank_series.parquet").exists():
+            master = pd.read_csv(DST, encoding="utf-8-sig")
+            write_parquet(master)
+            write_model(master)
+        print("✅ master.csv up to date (0 partitions changed)")
+        return None
+
+    if reuse:
+        master = pd.read_csv(DST, encoding="utf-8-sig")
+        hit = _part_of(master["issue_id"]).isin(changed)
+        old_part, master = master[hit], master[~hit]
+    else:
+        master = pd.DataFrame(columns=MASTER_COLS)
+        # 作り直しでも、差分（changed_issues）は既存の master.csv と比べて出す
+        old_part = pd.read_csv(DST, encoding="utf-8-sig") if DST.exists() else master
+
+    with metrics.timer("etl.transform"):
+        new_part = transform(raw[_part_of(raw["issue_id"]).isin(changed)].copy())
+        df = pd.concat([master, new_part[MASTER_COLS]], ignore_index=True) \
+               .sort_values(["magazine", "year", "month", "rank"], kind="stable")
+    with metrics.timer("etl.write"):
+        df.to_csv(DST, index=False, encoding="utf-8-sig",
+              lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
+        write_parquet(df)
+        write_model(df)
+    metrics.count("etl.partitions_rebuilt", len(changed))
+    metrics.count("etl.rows", len(df))
+
+    # 中身が変わった号（validate の差分検査用）
+    before, after = _issue_digest(old_part), _issue_digest(new_part)
+    touched = sorted(i for i in before.keys() | after.keys() if before.get(i) != after.get(i))
+    save_manifest(dict(etl_version=ETL_VERSION, master_sha256=_sha(DST.read_bytes()),
+                       partitions=hashes, changed_issues=touched))
+    print(f"✅ master.csv updated: {len(df)} rows "
+          f"({len(changed)}/{len(hashes)} partitions rebuilt, {len(touched)} issues changed)")
+    return df
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="全パーティションを作り直す")
+    main(full=ap.parse_args().full)
@@ -0,0 +1,150 @@
+"""
+fetch.py
+ 号ページ／年ページ取得用の共通フェッチャ。
+  - requests.Session を 1 本だけ持ち、コネクションをプールして使い回す
+  - ホストごとに「秒間リクエスト数 (rps)」の上限を守る
+  - 同時に飛ばすリクエスト数は worker 数で頭打ち
+  - HtmlCache を渡すと ETag / Last-Modified で条件付き GET、
+    offline=True ならネットワークに出ずキャッシュだけで応答する
+  - 取得時間・転送量・キャッシュヒット・レート制限の待ち時間を metrics に記録する
+"""
+from __future__ import annotations
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from html_cache import HtmlCache, CacheMiss, content_hash
+import metrics
+
+UA = {"User-Agent": "Mozilla/5.0"}
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# ────────────────────────────────────────────────────────────────
+class RateLimiter:
+    """
+    ホスト単位で 1/rps 秒ずつ間隔を空ける。
+    呼び出し側はロック内で「次に撃ってよい時刻」を予約し、ロック外で待つ。
+    """
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str) -> float:
+        """順番が来るまで待ち、待った秒数を返す"""
+        with self._lock:
+            now  = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+# ────────────────────────────────────────────────────────────────
+@dataclass
+class Page:
+    url: str
+    text: str
+    sha256: str
+    status: str     # "fetched" / "not_modified" (304) / "offline"
+    fetched_at: str = ""    # 最後にサーバーへ確認した時刻（offline ではキャッシュ側の値のまま）
+
+# ────────────────────────────────────────────────────────────────
+class Fetcher:
+    """
+    プール済み Session + ホスト別レート制限 + 同時実行数制限
+      fetcher = Fetcher(rps=2, workers=4)
+      html = fetcher.get(url)
+      page = fetcher.fetch(url)          # 本文＋ハッシュ＋取得状況
+      for item, result, err in fetcher.map(fn, items): ...
+    """
+    def __init__(self, *, rps: float = 2.0, workers: int = 4,
+                 timeout: float = 15, headers: dict | None = None,
+                 cache: HtmlCache | None = None, offline: bool = False):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cache   = cache
+        self.offline = offline
+        if offline and cache is None:
+            raise ValueError("offline モードには cache が必要です")
+        self.limiter = RateLimiter(rps)
+        self.sess = requests.Session()
+        self.sess.headers.update(headers or UA)
+        adapter = HTTPAdapter(pool_connections=self.workers,
+                              pool_maxsize=self.workers)
+        self.sess.mount("https://", adapter)
+        self.sess.mount("http://", adapter)
+
+    def get(self, url: str) -> str:
+        """本文だけ返す版の fetch"""
+        return self.fetch(url).text
+
+    def fetch(self, url: str) -> Page:
+        """
+        レート制限を守って GET する（200/304 以外は例外）。
+        キャッシュがあれば条件付き GET、304 ならキャッシュの本文を返す。
+        """
+        entry = self.cache.lookup(url) if self.cache else None
+        if self.offline:
+            if entry is None:
+                metrics.count("fetch.cache_miss")
+                raise CacheMiss(url)
+            metrics.count("fetch.cache_hit")
+            return Page(url, self.cache.read(entry), entry.sha256, "offline",
+                        entry.fetched_at)
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        # レート制限の待ちは取得時間に含めず別に積む
+        metrics.add_time("fetch.throttle", self.limiter.wait(urlsplit(url).netloc))
+        t = time.perf_counter()
+        res = self.sess.get(url, headers=headers, timeout=self.timeout)
+        metrics.observe("fetch.latency_ms", (time.perf_counter() - t) * 1000)
+        metrics.count("fetch.requests")
+        metrics.count("fetch.bytes", len(res.content))
+        if res.status_code == 304 and entry is not None:
+            metrics.count("fetch.cache_hit")
+            entry.fetched_at = datetime.now().isoformat(timespec="seconds")
+            self.cache.save(entry)
+            return Page(url, self.cache.read(entry), entry.sha256, "not_modified",
+                        entry.fetched_at)
+        res.raise_for_status()
+
+        text = res.text
+        metrics.count("fetch.cache_miss")
+        if self.cache is None:
+            return Page(url, text, content_hash(text), "fetched",
+                        datetime.now().isoformat(timespec="seconds"))
+        entry = self.cache.store(url, text,
+                                 etag=res.headers.get("ETag"),
+                                 last_modified=res.headers.get("Last-Modified"))
+        return Page(url, text, entry.sha256, "fetched", entry.fetched_at)
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]
+            ) -> Iterator[tuple[T, R | None, Exception | None]]:
+        """
+        items を worker 数まで並列に fn へ渡す。
+        結果は入力順に (item, 戻り値, 例外) で返す。
+        """
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            futs = [ex.submit(fn, it) for it in items]
+            for it, fut in zip(items, futs):
+                try:
+                    yield it, fut.result(), None
+                except Exception as e:
+                    yield it, None, e
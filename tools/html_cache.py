@@ -0,0 +1,85 @@
+"""
+html_cache.py
+ 号ページ／年ページの HTML をディスクに保存する内容アドレス型キャッシュ。
+   .cache/html/index/<sha1(url)>.json              … URL ごとのメタ情報
+   .cache/html/objects/<sha256[:2]>/<sha256>.html  … 本文（同じ内容は 1 つだけ）
+ メタ情報には ETag / Last-Modified を持ち、Fetcher が条件付き GET に使う。
+"""
+from __future__ import annotations
+import hashlib, json, os, tempfile
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parents[1] / ".cache" / "html"
+
+# ────────────────────────────────────────────────────────────────
+class CacheMiss(LookupError):
+    """--offline でキャッシュに無い URL を要求された"""
+
+@dataclass
+class Entry:
+    url: str
+    sha256: str                 # 本文 (UTF-8) のハッシュ
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: str = ""        # 最後にサーバーへ確認した時刻 (ISO 8601)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# ────────────────────────────────────────────────────────────────
+class HtmlCache:
+    def __init__(self, root: Path | str = CACHE_DIR):
+        self.root = Path(root)
+
+    def _index_path(self, url: str) -> Path:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.root / "index" / f"{key}.json"
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / f"{sha256}.html"
+
+    def lookup(self, url: str) -> Entry | None:
+        """URL のメタ情報（本文が欠けていれば None）"""
+        p = self._index_path(url)
+        if not p.exists():
+            return None
+        entry = Entry(**json.loads(p.read_text(encoding="utf-8")))
+        if not self._object_path(entry.sha256).exists():
+            return None
+        return entry
+
+    def read(self, entry: Entry) -> str:
+        return self._object_path(entry.sha256).read_text(encoding="utf-8")
+
+    def store(self, url: str, text: str, *,
+              etag: str | None = None, last_modified: str | None = None) -> Entry:
+        """本文とメタ情報を保存して Entry を返す"""
+        sha = content_hash(text)
+        obj = self._object_path(sha)
+        if not obj.exists():
+            _write_atomic(obj, text.encode("utf-8"))
+        entry = Entry(url, sha, etag, last_modified,
+                      datetime.now().isoformat(timespec="seconds"))
+        self.save(entry)
+        return entry
+
+    def save(self, entry: Entry) -> None:
+        _write_atomic(self._index_path(entry.url),
+                      json.dumps(asdict(entry), ensure_ascii=False).encode("utf-8"))
+
+
+    def entries(self):
+        """キャッシュ済みの全 Entry（本文が欠けているものは除く）"""
+        for p in sorted((self.root / "index").glob("*.json")):
+            entry = Entry(**json.loads(p.read_text(encoding="utf-8")))
+            if self._object_path(entry.sha256).exists():
+                yield entry
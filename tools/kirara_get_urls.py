@@ -3,12 +3,18 @@ kirara_get_urls.py
  公式サイトの年別ページを巡回して “号 URL 一覧 CSV” を更新する。
 
 使い方:
-  # 全誌をデフォルト月数で
+  # 全誌を雑誌ごとのデフォルト月数 (MONTH_AHEAD) で、1 回の実行で
   python tools/kirara_get_urls.py
 
   # きららは +1 か月先まで、MAX は +2
   python tools/kirara_get_urls.py --slug kirara --month_ahead 1
   python tools/kirara_get_urls.py --slug kirara-max --month_ahead 2
+
+  # 既存インデックスで揃っている年も含めて全年を取り直す
+  python tools/kirara_get_urls.py --full
+
+  # ネットワークに出ず HTML キャッシュだけで再構築
+  python tools/kirara_get_urls.py --offline
 """
 import re
 import csv
@@ -19,6 +25,10 @@ from datetime import datetime, timedelta
 
 import requests
 
+from fetch import Fetcher
+from html_cache import HtmlCache, CacheMiss
+import metrics
+
 BASE = "https://www.dokidokivisual.com"
 MAGAZINES = {                     # slug : 日本語名
     "kirara-carat":   "きららキャラット",
@@ -29,6 +39,15 @@ MAGAZINES = {                     # slug : 日本語名
 }
 YEAR_START = 2007                 # 初年度
 YEAR_END   = 2025                 # 必要なら更新
+MONTH_AHEAD = {                   # slug : 今日から何か月先の号まで取得するか
+    "kirara":         1,
+    "kirara-max":     2,
+    "kirara-carat":   2,
+    "kirara-forward": 2,
+    "kirara-miracle": 2,
+}
+# 最新号がこれより古い雑誌は休刊とみなし、その後の年ページは見に行かない
+ENDED_AFTER_MONTHS = 12
 
 HEADERS = {
     # ブロック回避用に普通のブラウザ名を名乗る
@@ -45,16 +64,15 @@ PATTERNS = {
 OUT_CSV = Path(__file__).resolve().parents[1] / "tools" / "kirara_issue_urls.csv"
 # ↑ 場所はプロジェクトに合わせて変更可
 # ──────────────────────────────────────────────
-def harvest_year(slug: str, year: int, sess: requests.Session) -> list[tuple]:
+def harvest_year(slug: str, year: int, fetcher: Fetcher) -> list[tuple]:
     """年ページをパースして (slug, year, month, url) タプルを返す"""
     url = f"{BASE}/magazine/{slug}/{year}/"
     try:
-        res = sess.get(url, timeout=15)
-        if res.status_code != 200:
-            return []
-        html = res.text
-    except requests.RequestException:
+        html = fetcher.get(url)
+    except (requests.RequestException, CacheMiss):
+        metrics.count("get_urls.errors")
         return []
+    metrics.count("get_urls.pages_parsed")
 
     rows = []
     for y, m, pk in PATTERNS[slug].findall(html):
@@ -64,34 +82,71 @@ def harvest_year(slug: str, year: int, sess: requests.Session) -> list[tuple]:
             m = 11
         rows.append((slug, int(y), int(m), full))
     return rows
-# ──────────────────────────────────────────────
-def cli() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--slug", nargs="*", choices=list(MAGAZINES), help="対象雑誌（省略で全て）")
-    ap.add_argument("--month_ahead", type=int, default=2,
-                    help="今日から何か月先の号まで取得するか（デフォルト 2）")
-    ap.add_argument("--out_csv", default=str(OUT_CSV))
-    args = ap.parse_args()
-
-    targets = args.slug or list(MAGAZINES)
-    sess = requests.Session(); sess.headers.update(HEADERS)
-
-    today = datetime.now()
-    latest = today + timedelta(days=30 * args.month_ahead)
-    year_range = range(2007, latest.year + 1)   # 2007 以降がサイトに存在
-
-    all_rows: list[tuple] = []
-    for slug in targets:
-        for yr in year_range:
-            all_rows.extend(harvest_year(slug, yr, sess))
+def plan_years(known: dict[int, set[int]], latest: datetime, today: datetime,
+               *, full: bool = False) -> list[int]:
+    """
+    年ページを取りに行く年を返す。known は既存インデックスの {年: {月, …}}。
+      - 創刊前（インデックス最古年より前）の年は見ない
+      - 休刊誌（最新号が ENDED_AFTER_MONTHS か月以上前）は最終年より後を見ない
+      - 過去年で 12 月号まで揃っている年は確定済みとして見ない
+    """
+    years = range(YEAR_START, latest.year + 1)
+    if full or not known:
+        return list(years)
+    first, last = min(known), max(known)
+    last_ym = last * 12 + max(known[last])
+    ended = today.year * 12 + today.month - last_ym > ENDED_AFTER_MONTHS
+    todo = []
+    for yr in years:
+        if yr < first or (ended and yr > last):
+            continue
+        if yr < latest.year and 12 in known.get(yr, ()):
+            continue
+        todo.append(yr)
+    return todo
 
-    # ─── 既存 CSV をマージして重複除去 ───
-    out_path = Path(args.out_csv)
+# ──────────────────────────────────────────────
+def update_urls(targets: list[str] | None = None, *, month_ahead: int | None = None,
+                out_csv: Path | str = OUT_CSV, rps: float = 2.0, workers: int = 4,
+                full: bool = False, offline: bool = False) -> pd.DataFrame:
+    """
+    年ページを取得して号 URL 一覧 CSV を更新し、その中身
+    (種別, 年, 月, URL) を DataFrame で返す（run_pipeline から直接呼ぶ）
+    """
+    targets = targets or list(MAGAZINES)
+    fetcher = Fetcher(rps=rps, workers=workers, headers=HEADERS,
+                      cache=HtmlCache(), offline=offline)
+
+    # ─── 既存 CSV を先に読み、取りに行く年を決める ───
+    out_path = Path(out_csv)
+    existing: list[tuple] = []
     if out_path.exists():
         with out_path.open(encoding="utf-8-sig") as f:
             reader = csv.DictReader(f)
             for r in reader:
-                all_rows.append((r["種別"], int(r["年"]), int(r["月"]), r["URL"]))
+                existing.append((r["種別"], int(r["年"]), int(r["月"]), r["URL"]))
+    known: dict[str, dict[int, set[int]]] = {}
+    for slug, yr, mo, _ in existing:
+        known.setdefault(slug, {}).setdefault(yr, set()).add(mo)
+
+    today = datetime.now()
+    plan: list[tuple[str, int]] = []
+    for slug in targets:
+        ahead = month_ahead if month_ahead is not None else MONTH_AHEAD[slug]
+        latest = today + timedelta(days=30 * ahead)
+        plan += [(slug, yr) for yr in plan_years(known.get(slug, {}), latest, today,
+                                                 full=full)]
+    print(f"▶ {len(plan)} year pages: " +
+          ", ".join(f"{s}/{y}" for s, y in plan))
+
+    # ─── 全誌の年ページをまとめて並列取得 ───
+    all_rows: list[tuple] = []
+    for _, rows, _ in fetcher.map(lambda p: harvest_year(*p, fetcher), plan):
+        all_rows.extend(rows or [])
+    metrics.count("get_urls.rows", len(all_rows))
+
+    # ─── 既存 CSV をマージして重複除去（既存行を優先） ───
+    all_rows.extend(existing)
 
     # dict で URL 重複排除 → ソート
     uniq = {r[3]: r for r in all_rows}.values()
@@ -104,6 +159,25 @@ def cli() -> None:
         w.writerows(sorted_rows)
 
     print(f"✅ {len(sorted_rows)} 行を書き出しました → {out_path}")
+    return pd.DataFrame(sorted_rows, columns=["種別", "年", "月", "URL"])
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--slug", nargs="*", choices=list(MAGAZINES), help="対象雑誌（省略で全て）")
+    ap.add_argument("--month_ahead", type=int,
+                    help="今日から何か月先の号まで取得するか（省略で雑誌ごとの MONTH_AHEAD）")
+    ap.add_argument("--out_csv", default=str(OUT_CSV))
+    ap.add_argument("--rps", type=float, default=2.0,
+                    help="秒間リクエスト数の上限（デフォルト 2）")
+    ap.add_argument("--workers", type=int, default=4,
+                    help="同時リクエスト数の上限（デフォルト 4）")
+    ap.add_argument("--full", action="store_true",
+                    help="確定済みの年・休刊後の年も含めて全年ページを取得する")
+    ap.add_argument("--offline", action="store_true",
+                    help="ネットワークに出ず HTML キャッシュだけで処理する")
+    args = ap.parse_args()
+    update_urls(args.slug, month_ahead=args.month_ahead, out_csv=args.out_csv,
+                rps=args.rps, workers=args.workers, full=args.full, offline=args.offline)
 
 # ──────────────────────────────────────────────
 if __name__ == "__main__":
@@ -4,14 +4,13 @@ validate 結果 → overrides/issues_fix.csv に未対応 TODO を追記
 """
 from pathlib import Path
 import pandas as pd
-from validate import validate_df
+from validate import validate_df, load_master
 
 BASE      = Path(__file__).resolve().parents[1]
 OV_FILE   = BASE / "overrides" / "issues_fix.csv"
-MASTER    = BASE / "data" / "master.csv"
 
 def main() -> None:
-    df_master = pd.read_csv(MASTER)
+    df_master = load_master()
     todo = validate_df(df_master)
 
     if todo.empty:
@@ -0,0 +1,76 @@
+"""
+metrics.py
+ 各ツール共通の計測（時間・カウンタ・分布）。
+   with metrics.timer("scrape.merge"): ...      # 区間の時間（秒、同名は合算）
+   metrics.count("fetch.bytes", len(body))      # カウンタ
+   metrics.observe("fetch.latency_ms", ms)      # 分布（p50 / p95 を出す）
+ 値はプロセス内の METRICS に溜まる。パイプラインは 1 プロセスで動くので、
+ run_pipeline.py が最後に METRICS.summary() をレポートに書き出す
+ （ツールを単体で動かしたときはレポートを書かない）。
+"""
+from __future__ import annotations
+import math, threading, time
+from contextlib import contextmanager
+from typing import Iterator
+
+def percentile(values: list[float], q: float) -> float | None:
+    """最近傍順位法のパーセンタイル（q は 0–100）"""
+    if not values:
+        return None
+    xs = sorted(values)
+    return xs[max(0, math.ceil(q / 100 * len(xs)) - 1)]
+
+# ────────────────────────────────────────────────────────────────
+class Metrics:
+    """スレッドから同時に触ってよい計測値の入れ物"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers:   dict[str, float] = {}
+        self.counters: dict[str, float] = {}
+        self.samples:  dict[str, list[float]] = {}
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.samples.setdefault(name, []).append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"timers": dict(self.timers), "counters": dict(self.counters),
+                    "samples": {k: list(v) for k, v in self.samples.items()}}
+
+    def summary(self) -> dict:
+        """timers は秒、分布は件数・p50・p95・最大"""
+        snap = self.snapshot()
+        return {
+            "timers_s": {k: round(v, 3) for k, v in sorted(snap["timers"].items())},
+            "counters": dict(sorted(snap["counters"].items())),
+            "distributions": {
+                k: {"n": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95),
+                    "max": max(v) if v else None}
+                for k, v in sorted(snap["samples"].items())
+            },
+        }
+
+# ────────────────────────────────────────────────────────────────
+# プロセス共通のインスタンス（ツールからは関数として使う）
+METRICS = Metrics()
+timer    = METRICS.timer
+add_time = METRICS.add_time
+count    = METRICS.count
+observe  = METRICS.observe
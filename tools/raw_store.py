@@ -0,0 +1,134 @@
+"""
+raw_store.py
+ raw 掲載行（号 × 掲載順）を SQLite に持つキー付きストア。
+  - キーは (url, rank)。号 (url) 単位で 1 トランザクションごと差し替える
+  - リポジトリに置く data/raw/<slug>.csv は決まった順序で書き出す
+  - DB は .cache/raw.sqlite（再生成可能）。CSV 側が手で直されるなど
+    最後の書き出しとハッシュが違えば、その雑誌ぶんを CSV から取り込み直す
+"""
+from __future__ import annotations
+import hashlib, os, sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+BASE    = Path(__file__).resolve().parents[1]
+RAW_DIR = BASE / "data" / "raw"
+DB_PATH = BASE / ".cache" / "raw.sqlite"
+
+RAW_COLS  = ["magazine", "year", "month", "url", "work", "rank",
+             "is_cover", "is_top", "is_center"]
+FLAG_COLS = ["is_cover", "is_top", "is_center"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appearances (
+    magazine  TEXT    NOT NULL,
+    year      INTEGER NOT NULL,
+    month     INTEGER NOT NULL,
+    url       TEXT    NOT NULL,
+    work      TEXT    NOT NULL,
+    rank      INTEGER NOT NULL,
+    is_cover  INTEGER NOT NULL,
+    is_top    INTEGER NOT NULL,
+    is_center INTEGER NOT NULL,
+    PRIMARY KEY (url, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_issue ON appearances (magazine, year, month);
+CREATE TABLE IF NOT EXISTS sources (
+    slug   TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+"""
+
+# ────────────────────────────────────────────────────────────────
+def write_csv_atomic(df: pd.DataFrame, path: Path) -> None:
+    """一時ファイルに書いてから置き換える（途中で落ちても壊れない）"""
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, path)
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def _records(rows) -> list[tuple]:
+    return [(r["magazine"], int(r["year"]), int(r["month"]), r["url"], r["work"],
+             int(r["rank"]), *(int(bool(r[c])) for c in FLAG_COLS)) for r in rows]
+
+# ────────────────────────────────────────────────────────────────
+class RawStore:
+    """
+      with RawStore() as store:
+          store.sync_csv()                       # CSV と食い違う雑誌を取り込み直す
+          store.replace_issues(urls, rows)       # 号ごと差し替え（1 トランザクション）
+          store.export_csv("kirara")             # data/raw/kirara.csv を書き出す
+    """
+    def __init__(self, path: Path | str = DB_PATH, raw_dir: Path | str = RAW_DIR):
+        self.path = Path(path)
+        self.raw_dir = Path(raw_dir)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(SCHEMA)
+
+    def __enter__(self) -> RawStore:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.con.close()
+
+    # ─── CSV → DB ───
+    def sync_csv(self) -> list[str]:
+        """最後に書き出したときとハッシュが違う CSV を取り込み直し、その slug を返す"""
+        known = dict(self.con.execute("SELECT slug, sha256 FROM sources"))
+        reloaded = []
+        for path in sorted(self.raw_dir.glob("*.csv")):
+            slug, sha = path.stem, _file_hash(path)
+            if known.get(slug) == sha:
+                continue
+            df = pd.read_csv(path, encoding="utf-8-sig")
+            if "magazine" not in df.columns:
+                df["magazine"] = slug
+            with self.con:
+                self.con.execute("DELETE FROM appearances WHERE magazine = ?", (slug,))
+                # 同じ (url, rank) が重なっていたら後ろ（新しい取得）を採る
+                self.con.executemany(
+                    "INSERT OR REPLACE INTO appearances VALUES (?,?,?,?,?,?,?,?,?)",
+                    _records(df.to_dict("records")))
+                self._mark(slug, sha)
+            reloaded.append(slug)
+        return reloaded
+
+    def _mark(self, slug: str, sha: str) -> None:
+        self.con.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (slug, sha))
+
+    # ─── 号単位の差し替え ───
+    def replace_issues(self, urls, rows: list[dict]) -> None:
+        """urls の号の行をすべて消し、rows を入れる（1 トランザクション）"""
+        with self.con:
+            self.con.executemany("DELETE FROM appearances WHERE url = ?",
+                                 [(u,) for u in urls])
+            self.con.executemany(
+                "INSERT OR REPLACE INTO appearances VALUES (?,?,?,?,?,?,?,?,?)",
+                _records(rows))
+
+    # ─── DB → DataFrame / CSV ───
+    def frame(self, slug: str | None = None) -> pd.DataFrame:
+        """決まった順序 (magazine, year, month, url, rank) で行を返す"""
+        sql = "SELECT * FROM appearances"
+        params: tuple = ()
+        if slug is not None:
+            sql += " WHERE magazine = ?"
+            params = (slug,)
+        sql += " ORDER BY magazine, year, month, url, rank"
+        df = pd.read_sql_query(sql, self.con, params=params)
+        df[FLAG_COLS] = df[FLAG_COLS].astype(bool)
+        return df[RAW_COLS]
+
+    def export_csv(self, slug: str) -> tuple[Path, pd.DataFrame]:
+        """data/raw/<slug>.csv を書き出して (パス, 書き出した DataFrame) を返す"""
+        df = self.frame(slug)
+        out = self.raw_dir / f"{slug}.csv"
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        write_csv_atomic(df, out)
+        with self.con:
+            self._mark(slug, _file_hash(out))
+        return out, df
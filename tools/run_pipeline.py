@@ -1,42 +1,155 @@
 """
-1. kirara_get_urls.py で号 URL を最新化
-2. scrape.py           今年分だけ取得し data/raw をマージ
-3. etl.py              master.csv を再生成
-4. validate.py         ALL PASS でなければ exit 1
+パイプラインを 1 プロセスで通しで実行する（各ツールの関数を直接呼び、DataFrame を受け渡す）
+1. get_urls  kirara_get_urls.update_urls  号 URL を最新化（kirara_issue_urls.csv も更新）
+2. scrape    scrape.scrape                今年分だけ取得し data/raw をマージ
+3. etl       etl.main                     master.csv / Parquet / モデルを再生成
+4. validate  validate.validate_df         ALL PASS でなければ警告を表示
+  $ python tools/run_pipeline.py [--offline]   # --offline: HTML キャッシュだけで実行
+  $ python tools/run_pipeline.py --from etl    # 指定の段から（前段の結果はファイルから読む）
+  $ python tools/run_pipeline.py --resume      # 前回落ちた段から再開
+
+段が終わるたびに .cache/pipeline_checkpoint.json へ記録し、最後まで通ったら消す。
+各段の所要時間と、各ツールが metrics で記録した値（取得時間 p50/p95・転送量・
+パース数・行数・キャッシュヒット・レート制限の待ち時間）を
+.cache/metrics/run-<日時>.json（と latest.json）に書き出す。
 """
+from __future__ import annotations
 from datetime import datetime
 from pathlib import Path
-import subprocess, sys
+import argparse, json, time
+
+import pandas as pd
+
+import etl, kirara_get_urls, metrics, scrape, validate
 
 ROOT  = Path(__file__).resolve().parents[1]
-TOOLS = ROOT / "tools"
-PY    = sys.executable
-
-def run(script, *args):
-    cmd = [PY, script, *args]
-    print("▶", *cmd)
-    res = subprocess.run(cmd, cwd=TOOLS)
-    if res.returncode:
-        sys.exit(res.returncode)
-
-MAG_OFFSET = {
-    "kirara": 1,
-    "kirara-max": 2,
-    "kirara-carat": 2,
-    "kirara-forward": 2,
-    "kirara-miracle": 2
-}
-
-def run_get_urls():
-    for slug, offset in MAG_OFFSET.items():
-        run("kirara_get_urls.py", "--slug", slug, "--month_ahead", str(offset))                       # ← kirara_page.py を改名
-run_get_urls()         
-this_year = str(datetime.now().year)
-run("scrape.py", "--start", this_year)
-run("etl.py")
-
-# バリデーションに引っかかったら終了 警告のみに修正
-res = subprocess.run([PY, "validate.py", "../data/master.csv"], cwd=TOOLS)
-if res.returncode != 0:
-    print("❌ Validation failed — aborting CI")
-    #sys.exit(res.returncode)
+REPORT_DIR = ROOT / ".cache" / "metrics"
+CHECKPOINT = ROOT / ".cache" / "pipeline_checkpoint.json"
+STAGES = ["get_urls", "scrape", "etl", "validate"]
+
+# ────────────────────────────────────────────────────────────────
+# 各段: ctx（前段までの DataFrame）を受け取り、次段に渡すものを ctx に積む。
+# 前段を飛ばした場合は ctx に無いので、各ツールがファイルから読む。
+def stage_get_urls(ctx: dict, args) -> None:
+    # 全誌を 1 回で（雑誌ごとの先読み月数は kirara_get_urls.MONTH_AHEAD）
+    ctx["urls"] = kirara_get_urls.update_urls(offline=args.offline)
+
+def stage_scrape(ctx: dict, args) -> None:
+    this_year = datetime.now().year
+    urls = ctx.get("urls")
+    urls = (scrape.filter_years(urls, this_year) if urls is not None
+            else scrape.load_urls(kirara_get_urls.OUT_CSV, this_year))
+    ctx["raw"] = scrape.scrape(urls, offline=args.offline)
+
+def stage_etl(ctx: dict, args) -> None:
+    ctx["master"] = etl.main(given=ctx.get("raw"))
+
+def stage_validate(ctx: dict, args) -> None:
+    df = ctx.get("master")
+    if df is None:
+        df = validate.load_master()
+    with metrics.timer("validate.check"):
+        warn_df = validate.validate_df(df)
+    metrics.count("validate.rows", len(df))
+    metrics.count("validate.warnings", len(warn_df))
+    # バリデーションに引っかかったら終了 警告のみに修正
+    if not validate.report(warn_df):
+        print("❌ Validation failed — aborting CI")
+
+RUNNERS = {"get_urls": stage_get_urls, "scrape": stage_scrape,
+           "etl": stage_etl, "validate": stage_validate}
+
+# ────────────────────────────────────────────────────────────────
+def load_checkpoint() -> dict:
+    if not CHECKPOINT.exists():
+        return {}
+    return json.loads(CHECKPOINT.read_text(encoding="utf-8"))
+
+def save_checkpoint(cp: dict) -> None:
+    CHECKPOINT.parent.mkdir(parents=True, exist_ok=True)
+    CHECKPOINT.write_text(json.dumps(cp, ensure_ascii=False, indent=1), encoding="utf-8")
+
+def write_report(started: datetime, stages: dict[str, float], offline: bool) -> Path:
+    """各段の時間＋metrics の値を 1 本の JSON にまとめる"""
+    s = metrics.METRICS.summary()
+    c, d, tm = s["counters"], s["distributions"], s["timers_s"]
+    lat = d.get("fetch.latency_ms", {})
+    report = {
+        "started": started.isoformat(timespec="seconds"),
+        "offline": offline,
+        "wall_s": round(sum(stages.values()), 3),
+        "stages_s": stages,
+        "fetch": {
+            "requests":   int(c.get("fetch.requests", 0)),
+            "p50_ms":     round(lat["p50"], 1) if lat else None,
+            "p95_ms":     round(lat["p95"], 1) if lat else None,
+            "bytes":      int(c.get("fetch.bytes", 0)),
+            "cache_hits": int(c.get("fetch.cache_hit", 0)),
+            "cache_miss": int(c.get("fetch.cache_miss", 0)),
+            "throttle_s": tm.get("fetch.throttle", 0.0),   # レート制限で待った時間（別計上）
+        },
+        "pages_parsed": int(c.get("get_urls.pages_parsed", 0) + c.get("scrape.pages_parsed", 0)),
+        "rows": {"issue_urls": int(c.get("get_urls.rows", 0)),
+                 "scraped":    int(c.get("scrape.rows", 0)),
+                 "master":     int(c.get("etl.rows", 0)) or None},
+        **s,
+    }
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    out = REPORT_DIR / f"run-{started:%Y%m%d-%H%M%S}.json"
+    body = json.dumps(report, ensure_ascii=False, indent=1)
+    out.write_text(body, encoding="utf-8")
+    (REPORT_DIR / "latest.json").write_text(body, encoding="utf-8")
+
+    f = report["fetch"]
+    print(f"📊 {report['wall_s']:.1f}s  "
+          + "  ".join(f"{k} {v:.1f}s" for k, v in stages.items()))
+    print(f"   fetch {f['requests']} req  p50 {f['p50_ms']} ms  p95 {f['p95_ms']} ms  "
+          f"{f['bytes'] / 1e6:.1f} MB  cache hit {f['cache_hits']}  throttle {f['throttle_s']:.1f}s")
+    print(f"   pages {report['pages_parsed']}  rows {report['rows']}  → {out}")
+    return out
+
+def run(start: str = STAGES[0], args=None) -> None:
+    """start の段から最後まで実行する"""
+    started = datetime.now()
+    cp = {"started": started.isoformat(timespec="seconds"),
+          "offline": args.offline, "done": STAGES[:STAGES.index(start)]}
+    ctx: dict[str, pd.DataFrame | None] = {}
+    stages: dict[str, float] = {}
+    try:
+        for name in STAGES[STAGES.index(start):]:
+            print(f"▶ {name}")
+            t = time.perf_counter()
+            with metrics.timer(f"stage.{name}"):
+                RUNNERS[name](ctx, args)
+            stages[name] = round(time.perf_counter() - t, 3)
+            print(f"  ⏱ {name}: {stages[name]:.1f}s")
+            cp["done"].append(name)
+            save_checkpoint(cp)
+    finally:
+        write_report(started, stages, args.offline)
+    CHECKPOINT.unlink(missing_ok=True)
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offline", action="store_true",
+                    help="ネットワークに出ず HTML キャッシュだけで処理する")
+    ap.add_argument("--from", dest="start", choices=STAGES,
+                    help="この段から実行する（前段の結果はファイルから読む）")
+    ap.add_argument("--resume", action="store_true",
+                    help="チェックポイントの続き（前回終わっていない段）から実行する")
+    args = ap.parse_args()
+
+    start = args.start or STAGES[0]
+    if args.resume and not args.start:
+        done = load_checkpoint().get("done", [])
+        todo = [s for s in STAGES if s not in done]
+        if not todo:
+            print("✅ checkpoint: all stages done")
+            return
+        start = todo[0]
+        print(f"↻ resume from {start}（done: {', '.join(done) or '-'}）")
+    run(start, args)
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    cli()
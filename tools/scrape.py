@@ -2,15 +2,42 @@
 スクレイパ: kirara_issue_urls.csv に列挙された全ての号を取得し
 data/raw/<slug>.csv を雑誌ごとに出力する
   $ python tools/scrape.py --start 2013
+  $ python tools/scrape.py --start 2013 --rps 2 --workers 4   # 並列取得
+  $ python tools/scrape.py --start 2013 --offline              # キャッシュだけで再パース
+  $ python tools/scrape.py --start 2013 --recheck              # 確定済みの号も再確認
+  $ python tools/scrape.py --start 2007 --reparse              # キャッシュ全号を全コアで再パース
+
+号ごとの取得状態 (URL / 本文ハッシュ / 取得時刻 / パーサ版) を
+.cache/scrape_state.csv に持ち、本文もパーサも変わっていない号はパースしない。
+（取得時刻は毎回変わるのでリポジトリには置かない。--offline の読み出しでは進めない）
+変わった号は raw_store (SQLite) で該当 URL の行をまるごと差し替え、
+その雑誌の data/raw/<slug>.csv を書き出す。
+全期間をまとめて取り込むときは backfill.py（(雑誌, 年) 単位で書き込み・中断から再開）を使う。
 """
 from __future__ import annotations
-import re, time, unicodedata, argparse
+import re, unicodedata, argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
 import pandas as pd, requests, bs4
+from lxml import etree
+
+from fetch import Fetcher, Page
+from html_cache import HtmlCache, Entry
+from raw_store import RawStore, write_csv_atomic
+import metrics
 
 # ────────────────────────────────────────────────────────────────
 UA        = {"User-Agent": "Mozilla/5.0"}
 DATA_DIR  = Path(__file__).resolve().parents[1] / "data" / "raw"
+STATE_CSV = DATA_DIR.parents[1] / ".cache" / "scrape_state.csv"
+LEGACY_STATE_CSV = DATA_DIR.parent / "scrape_state.csv"    # 以前の置き場所（読むだけ）
+STATE_COLS = ["url", "magazine", "year", "month",
+              "sha256", "fetched_at", "parser_version"]
+# パース規則を変えたら +1 する（全号が再パース対象になる）
+PARSER_VERSION = 1
+# 号の月から何か月後以降に取得済みなら「確定」とみなして再取得しないか
+SETTLE_MONTHS = 3
 #TITLE_RE  = re.compile(r"[「『]([^「『」』]+)[」』]")
 #新フォーマットでは２重カギカッコだけ抜けば良さそうなので修正
 TITLE_RE  = re.compile(r"[「『]([^「『」』]+)[」』]")
@@ -186,9 +213,212 @@ def extract_lineup(soup: bs4.BeautifulSoup) -> list[str]:
     return works
 
 # ────────────────────────────────────────────────────────────────
-def parse_issue(url: str, magazine: str) -> list[dict]:
+# 高速パス: lxml の木を直接 1 回だけ走査する版
+#   extract_color_blocks / extract_lineup（bs4 版）と同じ結果を返す。
+#   bs4 の get_text(strip=True) / stripped_strings / next_siblings の
+#   挙動（rt・script などの中の文字列を本文扱いしない点も含む）を再現している。
+#   規則を変えるときは両方を直し、tools/check_parser.py で突き合わせること。
+STRING_CONTAINERS = {"rt", "rp", "style", "script", "template"}
+CLASS_RE = re.compile(r"\S+")
+
+def _lx_parse(html: str):
+    """bs4(lxml) と同じく HTMLParser に feed して木を作る"""
+    if html[:1] == "\ufeff":
+        html = html[1:]
+    parser = etree.HTMLParser(recover=True)
+    try:
+        parser.feed(html)
+        return parser.close()
+    except etree.XMLSyntaxError:
+        return None
+
+def _lx_container(el) -> str | None:
+    """el 自身を含む直近の STRING_CONTAINERS 祖先のタグ名"""
+    while el is not None:
+        if el.tag in STRING_CONTAINERS:
+            return el.tag
+        el = el.getparent()
+    return None
+
+def _lx_walk(el, want: str | None, ctx: str | None):
+    """el 配下の文字列のうち、所属コンテナが want のものを文書順に返す"""
+    inner = el.tag if el.tag in STRING_CONTAINERS else ctx
+    if el.text and inner == want:
+        yield el.text
+    for ch in el:
+        if isinstance(ch.tag, str):          # コメント・PI の中身は読まない
+            yield from _lx_walk(ch, want, inner)
+        if ch.tail and inner == want:
+            yield ch.tail
+
+def _lx_strings(el) -> list[str]:
+    """bs4 の el.stripped_strings 相当"""
+    want = el.tag if el.tag in STRING_CONTAINERS else None
+    ctx  = _lx_container(el.getparent())
+    return [s for s in (t.strip() for t in _lx_walk(el, want, ctx)) if s]
+
+def _lx_text(el, sep: str = "") -> str:
+    """bs4 の el.get_text(sep, strip=True) 相当"""
+    return sep.join(_lx_strings(el))
+
+def _lx_block(h2, sep: str) -> list[tuple[bool, str]]:
+    """h2 の後ろ、次の h2 までの兄弟を (<p> か, get_text) で返す"""
+    plain = _lx_container(h2.getparent()) is None   # 兄弟文字列が本文扱いか
+    out: list[tuple[bool, str]] = []
+    if h2.tail:
+        out.append((False, h2.tail.strip() if plain else ""))
+    for sib in h2.itersiblings():
+        if sib.tag == "h2":
+            break
+        if isinstance(sib.tag, str):
+            out.append((sib.tag == "p", _lx_text(sib, sep)))
+        else:                                # コメント等は空文字扱い
+            out.append((False, ""))
+        if sib.tail:
+            out.append((False, sib.tail.strip() if plain else ""))
+    return out
+
+def _lx_color_blocks(h2s: list, desc, *, new_layout: bool, magazine: str) -> list[str]:
+    """extract_color_blocks の高速版"""
+    color: list[str] = []
+
+    def add(lbl: str, raw: str):
+        t = clean_title(raw)
+        if t:
+            color.append(f"{lbl}:{t}")
+
+    # ───── kirara‑forward 専用 ─────
+    if magazine == "kirara-forward":
+        if new_layout:
+            for h2 in h2s:
+                lbl = _lx_text(h2)
+                if "表紙" not in lbl and "巻頭" not in lbl:
+                    continue
+                m = TITLE_RE.search(" ".join(t for _, t in _lx_block(h2, " ")))
+                if m:
+                    if "表紙" in lbl:
+                        add("表紙", m.group(1))
+                    if "巻頭" in lbl:
+                        add("巻頭", m.group(1))
+        elif desc is not None:
+            hyoushiari_flag = False
+            for tk in _lx_strings(desc):
+                if "表紙" in tk:
+                    hyoushiari_flag = True
+                m = TITLE_RE.search(tk)
+                if m and hyoushiari_flag:
+                    add("表紙", m.group(1))
+                    break
+        return color
+    # ───── その他 ─────
+    if new_layout:
+        for h2 in h2s:
+            raw = _lx_text(h2)
+            lbls = []
+            if "表紙"   in raw: lbls.append("表紙")
+            if "巻頭"   in raw: lbls.append("巻頭")
+            if "センター" in raw: lbls.append("センターカラー")
+            if not lbls:
+                continue
+            for m in TITLE_RE.finditer("\n".join(t for _, t in _lx_block(h2, ""))):
+                for l in lbls:
+                    add(l, m.group(1))
+    elif desc is not None:
+        lbls = []
+        cover_used = False
+        for tk in _lx_strings(desc):
+            if "◆◆" in tk:
+                lbls = []
+                cover_used = False
+                if "表紙" in tk:            lbls.append("表紙")
+                if "巻頭" in tk:            lbls.append("巻頭")
+                if "センターカラー" in tk:  lbls.append("センターカラー")
+                continue
+            if "ラインナップ" in tk: break
+
+            m = TITLE_RE.search(tk)
+            if not m or not lbls: continue
+            if "表紙" in lbls and cover_used:
+                eff_lbls = [l for l in lbls if l != "表紙"]
+            else:
+                eff_lbls = lbls
+                if "表紙" in lbls: cover_used = True
+            for l in eff_lbls:
+                add(l, m.group(1))
+    return color
+
+def _lx_lineup(h2s: list, lineups: list) -> list[str]:
+    """extract_lineup の高速版"""
+    # 1) <ul class="lineup">
+    for ul in lineups:
+        cand = list(ul.iter("font")) or list(ul.iter("strong")) or list(ul.iter("li"))
+        if not cand:
+            continue
+        tmp = [clean_title(_lx_text(t, " ")) for t in cand]
+        if tmp and not any("休載" in x for x in tmp):
+            return tmp
+
+    # 2) <h2> ラインナップ … フォールバック
+    works: list[str] = []
+    for h2 in h2s:
+        if _lx_text(h2) != "ラインナップ":
+            continue
+        block = _lx_block(h2, "")
+        p_lines = [t for is_p, t in block if is_p]
+        if p_lines:
+            before = len(works)
+            for ln in p_lines:
+                if not ln or ln.startswith("※") or "休載" in ln:
+                    continue
+                if ln.count("『") > 1:
+                    for m in LINEUP_TITLE_RE.finditer(ln):
+                        works.append(std(CIRCLED_RE.sub("", m.group(1) or m.group(2))))
+                    continue
+                for op, cl in (("『", "』"), ("「", "」")):
+                    start = ln.find(op)
+                    end = ln.rfind(cl)
+                    if start != -1 and end > start:
+                        works.append(std(CIRCLED_RE.sub("", ln[start + 1:end])))
+                        break
+            if len(works) > before:
+                break
+        for ln in "\n".join(t for _, t in block).splitlines():
+            if "休載" in ln:
+                continue
+            for m in LINEUP_TITLE_RE.finditer(ln):
+                works.append(std(CIRCLED_RE.sub("", m.group(1) or m.group(2))))
+        break
+    return works
+
+def extract_fast(html: str, *, new_layout: bool, magazine: str) -> tuple[list[str], list[str]]:
+    """1 回のパース＋1 回の走査で (カラー行, ラインナップ) を返す"""
+    root = _lx_parse(html)
+    if root is None:
+        return [], []
+    h2s, lineups, desc = [], [], None
+    for el in root.iter():
+        tag = el.tag
+        if tag == "h2":
+            h2s.append(el)
+        elif tag == "ul" and "lineup" in CLASS_RE.findall(el.get("class", "")):
+            lineups.append(el)
+        elif tag == "div" and desc is None \
+                and "content-desc" in CLASS_RE.findall(el.get("class", "")):
+            desc = el
+    color = _lx_color_blocks(h2s, desc, new_layout=new_layout, magazine=magazine)
+    return color, _lx_lineup(h2s, lineups)
+
+# ────────────────────────────────────────────────────────────────
+def parse_issue(url: str, magazine: str, fetcher: Fetcher | None = None) -> list[dict]:
     """号ページ → 行リスト(dict)"""
-    soup = bs4.BeautifulSoup(requests.get(url, headers=UA, timeout=15).text, "lxml")
+    if fetcher is None:
+        html = requests.get(url, headers=UA, timeout=15).text
+    else:
+        html = fetcher.get(url)
+    return parse_html(html, url, magazine)
+
+def parse_html(html: str, url: str, magazine: str, *, fast: bool = True) -> list[dict]:
+    """号ページの HTML → 行リスト(dict)  fast=False で bs4 版（検証の基準）"""
     year, month = map(int, re.search(r"/(\d{4})/(\d{2})/", url).groups())
     #きららMAX2025-11月号　アドレスの月が12になっている件の対応
     if url =="https://www.dokidokivisual.com/magazine/kirara-max/2025/12/12720/" :
@@ -196,12 +426,20 @@ def parse_issue(url: str, magazine: str) -> list[dict]:
     
     new_layout  = (year > 2025) or (year == 2025 and month >= 3)
 
-    color_lines = extract_color_blocks(soup, new_layout=new_layout, magazine=magazine)
-    works       = extract_lineup(soup)
+    if fast:
+        color_lines, works = extract_fast(html, new_layout=new_layout, magazine=magazine)
+    else:
+        soup = bs4.BeautifulSoup(html, "lxml")
+        color_lines = extract_color_blocks(soup, new_layout=new_layout, magazine=magazine)
+        works       = extract_lineup(soup)
+
+    # キーを含むカラー行は先に絞っておく（作品ごとに全行を見ない）
+    flag_lines = {key: [c for c in color_lines if key in c]
+                  for key in ("表紙", "巻頭", "センターカラー")}
 
     def has_flag(w: str, key: str) -> bool:
         w = std(w)
-        return any(key in c and w in c for c in color_lines)
+        return any(w in c for c in flag_lines[key])
 
     rows = []
     for idx, w in enumerate(works, 1):
@@ -229,55 +467,196 @@ def parse_issue(url: str, magazine: str) -> list[dict]:
     return rows
 
 # ────────────────────────────────────────────────────────────────
-def cli() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--start", type=int, default=2026)
-    ap.add_argument("--end",   type=int)
-    ap.add_argument("--url_csv", default="kirara_issue_urls.csv")
-    args = ap.parse_args()
+def load_state(path: Path = STATE_CSV) -> dict[str, dict]:
+    """scrape_state.csv → {url: 状態 dict}"""
+    if not path.exists() and path == STATE_CSV:
+        path = LEGACY_STATE_CSV
+    if not path.exists():
+        return {}
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    return {r["url"]: r for r in df.to_dict("records")}
 
-    df_urls = pd.read_csv(args.url_csv, encoding="utf-8-sig")
-    if args.start:
-        df_urls = df_urls[df_urls["年"] >= args.start]
-    if args.end:
-        df_urls = df_urls[df_urls["年"] <= args.end]
+def save_state(state: dict[str, dict], path: Path = STATE_CSV) -> None:
+    df = pd.DataFrame(list(state.values()), columns=STATE_COLS)
+    df = df.sort_values(["magazine", "year", "month", "url"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_csv_atomic(df, path)
 
+def is_settled(prev: dict | None, year: int, month: int) -> bool:
+    """号の月 + SETTLE_MONTHS 以降に現行パーサで取得済みなら True"""
+    if prev is None or int(prev["parser_version"]) != PARSER_VERSION:
+        return False
+    if not isinstance(prev["fetched_at"], str) or not prev["fetched_at"]:
+        return False
+    m = year * 12 + (month - 1) + SETTLE_MONTHS
+    return datetime.fromisoformat(prev["fetched_at"]) >= datetime(m // 12, m % 12 + 1, 1)
+
+def scrape_issue(url: str, magazine: str, fetcher: Fetcher,
+                 prev: dict | None) -> tuple[Page, list[dict] | None]:
+    """
+    号ページを取得し、本文かパーサ版が前回と違うときだけパースする。
+    変化なしなら rows は None。
+    """
+    page = fetcher.fetch(url)
+    if (prev is not None and prev["sha256"] == page.sha256
+            and int(prev["parser_version"]) == PARSER_VERSION):
+        return page, None
+    with metrics.timer("scrape.parse"):
+        rows = parse_html(page.text, url, magazine)
+    metrics.count("scrape.pages_parsed")
+    metrics.count("scrape.rows", len(rows))
+    return page, rows
+
+def _reparse_one(job: tuple[str, Entry, str]) -> tuple[list[dict] | None, str | None]:
+    """
+    ProcessPool 用: キャッシュから本文を読んでパース（本文は pickle しない）。
+    1 号の失敗で全体が止まらないよう、例外は (None, メッセージ) で返す
+    """
+    cache_root, entry, magazine = job
+    try:
+        return parse_html(HtmlCache(cache_root).read(entry), entry.url, magazine), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def reparse_cached(jobs: list[tuple], cache: HtmlCache, procs: int | None = None):
+    """
+    キャッシュ済みの号を ProcessPoolExecutor で全コアに流して再パースする。
+    (job, Entry, rows, err) を jobs の順に返す。キャッシュに無い号は Entry/rows が None、
+    パースに失敗した号は rows が None で err にメッセージが入る。
+    """
+    hits = [(job, cache.lookup(job[0])) for job in jobs]
+    todo = [(str(cache.root), entry, job[1]) for job, entry in hits if entry is not None]
+    with ProcessPoolExecutor(max_workers=procs) as ex:
+        parsed = ex.map(_reparse_one, todo, chunksize=8)
+        for job, entry in hits:
+            rows, err = next(parsed) if entry is not None else (None, None)
+            yield job, entry, rows, err
+
+def merge_raw(rows_by_slug: dict[str, list[dict]],
+              changed_by_slug: dict[str, set[str]]) -> tuple[int, dict[str, pd.DataFrame]]:
+    """
+    変わった号を raw_store で差し替え、触った雑誌の CSV を書き出す。
+    (新行数, 書き出した雑誌 → その CSV と同じ中身の DataFrame) を返す
+    """
+    total = 0
+    frames: dict[str, pd.DataFrame] = {}
+    with RawStore(raw_dir=DATA_DIR) as store:
+        for slug in store.sync_csv():
+            print(f"  ↺ {slug}: raw CSV を取り込み直しました")
+        for slug, urls in changed_by_slug.items():
+            rows = rows_by_slug.get(slug, [])
+            # 変わった号は URL 単位で旧行を捨てて新行に差し替える
+            store.replace_issues(urls, rows)
+            out, frames[slug] = store.export_csv(slug)
+            print(f"  ✓ {slug}: {len(urls)} issues replaced, {len(frames[slug])} rows → {out}")
+            total += len(rows)          # ← 新たにスクレイプした行数で集計
+    return total, frames
+
+# ────────────────────────────────────────────────────────────────
+def load_urls(url_csv: Path | str = "kirara_issue_urls.csv",
+              start: int | None = None, end: int | None = None) -> pd.DataFrame:
+    """号 URL 一覧 CSV を読み、年で絞る"""
+    return filter_years(pd.read_csv(url_csv, encoding="utf-8-sig"), start, end)
+
+def filter_years(df_urls: pd.DataFrame, start: int | None = None,
+                 end: int | None = None) -> pd.DataFrame:
+    if start:
+        df_urls = df_urls[df_urls["年"] >= start]
+    if end:
+        df_urls = df_urls[df_urls["年"] <= end]
+    return df_urls
+
+def scrape(df_urls: pd.DataFrame, *, rps: float = 2.0, workers: int = 4,
+           offline: bool = False, recheck: bool = False, reparse: bool = False,
+           procs: int | None = None) -> dict[str, pd.DataFrame]:
+    """
+    df_urls (種別, 年, 月, URL) の号を取得・パースして raw に差し替える。
+    書き出した雑誌の raw を DataFrame で返す（run_pipeline が etl に直接渡す）
+    """
+    state = load_state()
+    prev_state = dict(state)            # worker からは読むだけ
+    jobs = [(u, s, y, m) for u, s, y, m in zip(df_urls["URL"], df_urls["種別"],
+                                               df_urls["年"], df_urls["月"])]
     rows_by_slug: dict[str, list[dict]] = {}
+    changed_by_slug: dict[str, set[str]] = {}   # 差し替える号の URL
 
-    for _, row in df_urls.iterrows():
-        url  = row["URL"]
-        slug = row["種別"]                  # kirara / kirara-max / carat / kirara-forward
-        print("▶", url)
-        try:
-            rows = parse_issue(url, slug)
+    # ───── 再パースモード: 取得は一切せず、キャッシュ全号を入れ替える ─────
+    if reparse:
+        for (url, slug, yr, mo), entry, rows, err in reparse_cached(jobs, HtmlCache(), procs):
+            if entry is None:
+                print("  [MISS]", url)
+                continue
+            if err is not None:
+                print("  [ERROR]", url, err)
+                continue
+            state[url] = dict(url=url, magazine=slug, year=int(yr), month=int(mo),
+                              sha256=entry.sha256, fetched_at=entry.fetched_at,
+                              parser_version=PARSER_VERSION)
+            changed_by_slug.setdefault(slug, set()).add(url)
             rows_by_slug.setdefault(slug, []).extend(rows)
-            time.sleep(1)                   # polite crawl
-        except Exception as e:
-            print("  [ERROR]", e)
+            metrics.count("scrape.pages_parsed")
+            metrics.count("scrape.rows", len(rows))
+        with metrics.timer("scrape.merge"):
+            total, frames = merge_raw(rows_by_slug, changed_by_slug)
+        save_state(state)
+        print(f"\n✅ reparse done: {total} rows from "
+              f"{sum(map(len, changed_by_slug.values()))} cached issues")
+        return frames
 
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    total = 0
-    for slug, rows in rows_by_slug.items():
-        out = DATA_DIR / f"{slug}.csv"
-        # ① 既存ファイルがあれば読み込み …
-        if out.exists():
-            old = pd.read_csv(out, encoding="utf-8-sig")
-            new = pd.DataFrame(rows)
-            merged = pd.concat([old, new], ignore_index=True)
-
-            # ② 同じ作品・同じrankの重複行は keep="first" で残す
-            merged = merged.drop_duplicates(
-                subset=["magazine", "year", "month", "work", "rank"],
-                keep="first"
-            )
-        else:
-            merged = pd.DataFrame(rows)
-        merged.to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"  ✓ {slug}: {len(merged)} rows (after merge) → {out}")
-        total += len(rows)          # ← 新たにスクレイプした行数で集計
+    if not recheck:
+        todo = [j for j in jobs if not is_settled(prev_state.get(j[0]), j[2], j[3])]
+        print(f"⏭ {len(jobs) - len(todo)} issues settled (skip)")
+        jobs = todo
+
+    # 取得＋パースは並列、結果の連結は URL 一覧の順番どおり
+    fetcher = Fetcher(rps=rps, workers=workers, cache=HtmlCache(), offline=offline)
+    for (url, slug, yr, mo), res, err in fetcher.map(
+            lambda job: scrape_issue(job[0], job[1], fetcher, prev_state.get(job[0])),
+            jobs):
+        print("▶", url)
+        if err is not None:
+            print("  [ERROR]", err)
+            continue
+        page, rows = res
+        state[url] = dict(url=url, magazine=slug, year=int(yr), month=int(mo),
+                          sha256=page.sha256, fetched_at=page.fetched_at,
+                          parser_version=PARSER_VERSION)
+        if rows is None:
+            print("  = unchanged")
+            continue
+        changed_by_slug.setdefault(slug, set()).add(url)
+        rows_by_slug.setdefault(slug, []).extend(rows)
+
+    with metrics.timer("scrape.merge"):
+        total, frames = merge_raw(rows_by_slug, changed_by_slug)
+    # raw を書き終えてから状態を保存（途中で落ちたら次回パースし直す）
+    save_state(state)
 
 
     print(f"\n✅ all done: {total} rows collected")
+    return frames
+
+def cli() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", type=int, default=2026)
+    ap.add_argument("--end",   type=int)
+    ap.add_argument("--url_csv", default="kirara_issue_urls.csv")
+    ap.add_argument("--rps", type=float, default=2.0,
+                    help="ホストあたり秒間リクエスト数の上限（デフォルト 2）")
+    ap.add_argument("--workers", type=int, default=4,
+                    help="同時リクエスト数の上限（デフォルト 4）")
+    ap.add_argument("--offline", action="store_true",
+                    help="ネットワークに出ず HTML キャッシュだけで処理する")
+    ap.add_argument("--recheck", action="store_true",
+                    help="確定済み (SETTLE_MONTHS 経過) の号も再取得する")
+    ap.add_argument("--reparse", action="store_true",
+                    help="ネットワークに出ずキャッシュ済み HTML を全コアで再パースする")
+    ap.add_argument("--procs", type=int,
+                    help="--reparse のプロセス数（省略で CPU コア数）")
+    args = ap.parse_args()
+    scrape(load_urls(args.url_csv, args.start, args.end), rps=args.rps,
+           workers=args.workers, offline=args.offline, recheck=args.recheck,
+           reparse=args.reparse, procs=args.procs)
 
 # ────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
@@ -1,11 +1,25 @@
 """
 master.csv を検査して表紙・巻頭・センターの整合性をチェック。
 issues_fix.csv に fixed=OK で登録された type は警告を無視する。
-CLI:  python tools/validate.py data/master.csv
+CLI:  python tools/validate.py                 # data/master.parquet（無ければ master.csv）
+      python tools/validate.py data/master.csv
+      python tools/validate.py --changed       # 直近の ETL で変わった号だけ
+
+号ごとの件数表を groupby().agg で 1 回作り、登録済みルール (RULES) を
+その表に当てて警告を出す。ルールを足すときは @rule("type名") で登録する。
 """
+from __future__ import annotations
 from pathlib import Path
+from typing import Callable
+import argparse, json
 import pandas as pd
 
+BASE     = Path(__file__).resolve().parents[1]
+FIX_PATH = BASE / "overrides" / "issues_fix.csv"
+MANIFEST = BASE / "data" / "etl_manifest.json"
+MASTER_PARQUET = BASE / "data" / "master.parquet"
+MASTER_CSV     = BASE / "data" / "master.csv"
+
 # ──────────────────────────────────────────────
 EXPECT = {
     "kirara"        : dict(cover=1, top=1, center=4),
@@ -16,74 +30,133 @@ EXPECT = {
 }
 
 # ──────────────────────────────────────────────
-def _make_issue_id(row):
-    return f"{row['magazine']}-{row['year']}-{row['month']:02d}"
+# ルール: 件数表 → (警告を出す行の mask, detail 文字列)
+RuleFn = Callable[[pd.DataFrame], "tuple[pd.Series, pd.Series]"]
+RULES: list[tuple[str, RuleFn]] = []
+
+def rule(type_: str):
+    """警告 type 名でルールを登録するデコレータ（登録順に出力される）"""
+    def deco(fn: RuleFn) -> RuleFn:
+        RULES.append((type_, fn))
+        return fn
+    return deco
+
+# ① 表紙
+@rule("cover_count")
+def _cover_count(t):
+    return t["cover"] != t["exp_cover"], t["cover"].astype(str) + " 作"
+
+# ② 巻頭
+@rule("top_count")
+def _top_count(t):
+    return t["top"] != t["exp_top"], t["top"].astype(str) + " 作"
+
+@rule("top_not_rank1")
+def _top_not_rank1(t):
+    ok = t["top"] == t["exp_top"]
+    return ok & (t["top"] == 1) & (t["top_rank"] != 1), \
+           "rank=" + t["top_rank"].fillna(0).astype(int).astype(str)
+
+# ③ センター（期待値 None の雑誌は見ない）
+@rule("center_count")
+def _center_count(t):
+    return t["exp_center"].notna() & (t["center"] != t["exp_center"]), \
+           t["center"].astype(str) + " 作"
 
 # ──────────────────────────────────────────────
-def _load_ignore_set() -> set[tuple[str, str, str]]:
+def load_ignore() -> pd.DataFrame:
     """
-    issues_fix.csv から fixed=OK 行の (magazine, issue_id, type) を収集。
-    手動修正行 (type NaN) は対象外。
+    issues_fix.csv から fixed=OK 行の (magazine, issue_id, type) を読む。
+    手動修正行 (type NaN) は対象外。呼ぶたびにファイルを読み直す。
     """
-    fix_path = Path(__file__).resolve().parents[1] / "overrides" / "issues_fix.csv"
-    ignore = set()
-    if fix_path.exists():
-        fix = pd.read_csv(fix_path)
-        ok_rows = fix[fix["fixed"].astype(str).str.upper() == "OK"]
-        ok_rows = ok_rows[pd.notna(ok_rows["type"])]          # 自動警告行のみ
-        for _, r in ok_rows.iterrows():
-            ignore.add( (r["magazine"], r["issue_id"], r["type"]) )
-    return ignore
-
-IGNORE = _load_ignore_set()
+    cols = ["magazine", "issue_id", "type"]
+    if not FIX_PATH.exists():
+        return pd.DataFrame(columns=cols)
+    fix = pd.read_csv(FIX_PATH)
+    ok_rows = fix[fix["fixed"].astype(str).str.upper() == "OK"]
+    ok_rows = ok_rows[pd.notna(ok_rows["type"])]          # 自動警告行のみ
+    return ok_rows[cols].drop_duplicates()
+
+def load_master(path: Path | str | None = None) -> pd.DataFrame:
+    """master を読む。path 省略時は Parquet を優先し、無ければ CSV"""
+    if path is None:
+        path = MASTER_PARQUET if MASTER_PARQUET.exists() else MASTER_CSV
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def changed_issues() -> list[str]:
+    """直近の etl.py 実行で中身が変わった issue_id（etl_manifest.json）"""
+    if not MANIFEST.exists():
+        return []
+    return json.loads(MANIFEST.read_text(encoding="utf-8")).get("changed_issues", [])
+
+def count_table(df: pd.DataFrame) -> pd.DataFrame:
+    """号ごとの件数表（表紙・巻頭・センター数、巻頭の rank、期待値）"""
+    flags = df[["is_cover", "is_top", "is_center"]].astype(bool)
+    t = (df.assign(is_cover=flags["is_cover"], is_top=flags["is_top"],
+                   is_center=flags["is_center"],
+                   top_rank=df["rank"].where(flags["is_top"]))
+           .groupby(["magazine", "year", "month"], sort=True, observed=True)
+           .agg(cover=("is_cover", "sum"), top=("is_top", "sum"),
+                center=("is_center", "sum"), top_rank=("top_rank", "min"))
+           .reset_index())
+    t["magazine"] = t["magazine"].astype(str)
+    t["issue_id"] = (t["magazine"] + "-" + t["year"].astype(str) + "-"
+                     + t["month"].astype(int).astype(str).str.zfill(2))
+    exp = t["magazine"].map(lambda m: EXPECT.get(m, EXPECT["default"]))
+    for k in ("cover", "top", "center"):
+        t[f"exp_{k}"] = exp.map(lambda e: e[k]).astype("float")
+    return t
 
 # ──────────────────────────────────────────────
-def validate_df(df: pd.DataFrame) -> pd.DataFrame:
+def validate_df(df: pd.DataFrame, issue_ids=None,
+                ignore: pd.DataFrame | None = None) -> pd.DataFrame:
     """
-    master DataFrame → 警告 DataFrame
-    IGNORE に含まれる (mag, issue_id, type) は除外
+    master DataFrame → 警告 DataFrame (magazine, issue_id, type, detail)
+    issue_ids を渡すとその号だけを見る。ignore（既定は issues_fix.csv）に
+    含まれる (mag, issue_id, type) は除外
     """
-    if "issue_id" not in df.columns:
-        df = df.assign(issue_id=df.apply(_make_issue_id, axis=1))
-
-    warnings = []
-    for (mag, yr, mo), g in df.groupby(["magazine", "year", "month"]):
-        expect = EXPECT.get(mag, EXPECT["default"])
-        issue_id = f"{mag}-{yr}-{mo:02d}"
-
-        # ① 表紙
-        cov = g["is_cover"].sum()
-        if cov != expect["cover"] and (mag, issue_id, "cover_count") not in IGNORE:
-            warnings.append(dict(magazine=mag, issue_id=issue_id,
-                                 type="cover_count", detail=f"{cov} 作"))
-
-        # ② 巻頭
-        tops = g[g["is_top"]]
-        if len(tops) != expect["top"] and (mag, issue_id, "top_count") not in IGNORE:
-            warnings.append(dict(magazine=mag, issue_id=issue_id,
-                                 type="top_count", detail=f"{len(tops)} 作"))
-        elif len(tops) == 1 and int(tops.iloc[0]["rank"]) != 1 \
-             and (mag, issue_id, "top_not_rank1") not in IGNORE:
-            warnings.append(dict(magazine=mag, issue_id=issue_id,
-                                 type="top_not_rank1",
-                                 detail=f"rank={int(tops.iloc[0]['rank'])}"))
-
-        # ③ センター
-        if expect["center"] is not None:
-            cen = g["is_center"].sum()
-            if cen != expect["center"] and (mag, issue_id, "center_count") not in IGNORE:
-                warnings.append(dict(magazine=mag, issue_id=issue_id,
-                                     type="center_count", detail=f"{cen} 作"))
-
-    return pd.DataFrame(warnings)
+    cols = ["magazine", "issue_id", "type", "detail"]
+    t = count_table(df)
+    if issue_ids is not None:
+        t = t[t["issue_id"].isin(set(issue_ids))]
+
+    hits = []
+    for order, (type_, fn) in enumerate(RULES):
+        mask, detail = fn(t)
+        hits.append(t.loc[mask, ["magazine", "year", "month", "issue_id"]]
+                     .assign(type=type_, detail=detail[mask], _order=order))
+    warn = pd.concat(hits, ignore_index=True)
+
+    ignore = load_ignore() if ignore is None else ignore
+    warn = warn.merge(ignore.assign(_ignored=True), how="left",
+                      on=["magazine", "issue_id", "type"])
+    warn = warn[warn["_ignored"].isna()]
+    if warn.empty:
+        return pd.DataFrame(columns=cols)
+    warn = warn.sort_values(["magazine", "year", "month", "_order"], kind="stable")
+    return warn[cols].reset_index(drop=True)
+
+def report(warn_df: pd.DataFrame) -> bool:
+    """結果を表示し、警告なしなら True"""
+    if warn_df.empty:
+        print("ALL PASS ✅")
+        return True
+    print(warn_df.to_string(index=False))
+    return False
 
 # ──────────────────────────────────────────────
 if __name__ == "__main__":
     import sys
-    warn_df = validate_df(pd.read_csv(sys.argv[1]))
-    if warn_df.empty:
-        print("ALL PASS ✅")
-        sys.exit(0)
-    else:
-        print(warn_df.to_string(index=False))
-        sys.exit(1)
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("master", nargs="?", default=None,
+                    help="master.parquet / master.csv（既定は Parquet 優先）")
+    ap.add_argument("--changed", action="store_true",
+                    help="直近の ETL で変わった issue_id だけ検査する")
+    args = ap.parse_args()
+
+    df = load_master(args.master)
+    warn_df = validate_df(df, changed_issues() if args.changed else None)
+    sys.exit(0 if report(warn_df) else 1)
\ No newline at end of file